@@ -16,7 +16,9 @@ import inspect
 from . wiz_panels import *
 from . wiz_armature import *
 from . wiz_utils import *
+from . batch_export import *
 from . animations import *
+from . keyframes import *
 from . normal_maps import *
 from . utils import *
 
@@ -0,0 +1,163 @@
+import os
+import hashlib
+import subprocess
+from contextlib import ExitStack
+import bpy
+from . utils import *
+
+LIBRARY_FOLDER = "action_library"
+LIBRARY_MANIFEST_FILE = "library_manifest.json"
+WORKER_FOLDER = "animation_workers"
+
+# Bump when the import settings change so previously converted clips are redone
+CACHE_VERSION = 2
+
+# Source file hashes keyed by path, reused while the file size and time are unchanged
+_source_hashes = {}
+
+# The library manifest and the time of the file it was read from
+_library_manifest = (None, {})
+
+
+def get_library_folder():
+    """
+    The converted clips don't depend on the Godot project so the library is shared
+    between all of them
+    """
+    return get_addon_user_path(LIBRARY_FOLDER)
+
+
+def get_scene_fps() -> str:
+    """
+    The scene's frame rate as text.  Clips are converted to the scene's frame rate so
+    it is part of the library key
+    """
+    render = bpy.context.scene.render
+    return f"{round(render.fps / render.fps_base, 3):g}"
+
+
+def get_source_hash(file_path: str) -> str:
+    stat = os.stat(file_path)
+    key = (stat.st_size, stat.st_mtime)
+    cached = _source_hashes.get(file_path)
+    if cached and cached[0] == key:
+        return cached[1]
+
+    hasher = hashlib.sha1(f"{CACHE_VERSION}".encode())
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            hasher.update(chunk)
+    _source_hashes[file_path] = (key, hasher.hexdigest())
+    return _source_hashes[file_path][1]
+
+
+def get_library_file(file_path: str) -> str:
+    return os.path.join(get_library_folder(), f"{get_source_hash(file_path)}_{get_scene_fps()}fps.blend")
+
+
+def _get_manifest_path() -> str:
+    return os.path.join(get_library_folder(), LIBRARY_MANIFEST_FILE)
+
+
+def get_library_bones(file_path: str):
+    """
+    Get the bone names of the source armature of a converted file.  These are kept in
+    the library manifest so the action itself carries nothing into the exported files
+    """
+    global _library_manifest
+    path = _get_manifest_path()
+    key = os.path.basename(get_library_file(file_path))
+    mtime = os.path.getmtime(path) if os.path.exists(path) else None
+    if mtime != _library_manifest[0] or key not in _library_manifest[1]:
+        _library_manifest = (mtime, read_manifest(path))
+    return _library_manifest[1].get(key, {}).get("source_bones", [])
+
+
+def is_converted(file_path: str) -> bool:
+    return os.path.exists(get_library_file(file_path))
+
+
+def get_pending_files(files) -> list:
+    """
+    Get the files that aren't in the library yet.  Files with the same contents
+    are only returned once
+    """
+    pending = {}
+    for file_path in files:
+        if not is_converted(file_path):
+            pending.setdefault(get_source_hash(file_path), file_path)
+    return sorted(pending.values())
+
+
+def write_library_action(file_path: str, action, bone_names):
+    """
+    Save the action imported from a file to the library.  The bone names of the source
+    armature are stored in the library manifest so it can be checked against the
+    destination armature without importing the file again
+    """
+    # Write to a temporary file first so a worker that dies can't leave half a library
+    library_file = get_library_file(file_path)
+    temp_file = f"{library_file}.{os.getpid()}.tmp"
+    bpy.data.libraries.write(temp_file, {action}, fake_user=True)
+    update_manifest(_get_manifest_path(), {
+        os.path.basename(library_file): {
+            "source_bones": sorted(bone_names),
+            "source_file": os.path.basename(file_path),
+        }
+    })
+    os.replace(temp_file, library_file)
+
+
+def append_library_action(file_path: str, name: str):
+    """
+    Append the action of a converted file from the library.  Returns None if the file
+    hasn't been converted
+    """
+    if not is_converted(file_path):
+        return None
+
+    with bpy.data.libraries.load(get_library_file(file_path), link=False) as (data_from, data_to):
+        data_to.actions = data_from.actions[:1]
+    if not data_to.actions:
+        return None
+
+    action = data_to.actions[0]
+    action.use_fake_user = False
+    action.name = name
+    return action
+
+
+def convert_animations_parallel(files, workers):
+    """
+    Convert the files using background Blender processes that each import their share
+    and write the actions to the library
+    """
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "headless.py")
+    folder = os.path.join(get_library_folder(), WORKER_FOLDER)
+    os.makedirs(folder, exist_ok=True)
+
+    render = bpy.context.scene.render
+    with ExitStack() as stack:
+        processes = []
+        for index in range(workers):
+            # The library folder is shared by every project so the logs are named after
+            # this process to keep conversions running at the same time apart
+            log = os.path.join(folder, f"worker_{os.getpid()}_{index}.log")
+            log_file = stack.enter_context(open(log, "w"))
+
+            # Workers start from the factory settings so they are given the scene's frame rate
+            command = [
+                bpy.app.binary_path,
+                "--background",
+                "--factory-startup",
+                "--python", script,
+                "--",
+                "convert-animations",
+                "--workers", "1",
+                "--fps", str(render.fps),
+                "--fps-base", str(render.fps_base),
+                *files[index::workers]]
+            processes.append(subprocess.Popen(command, stdout=log_file, stderr=subprocess.STDOUT))
+
+        for process in processes:
+            process.wait()
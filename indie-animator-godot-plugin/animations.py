@@ -1,6 +1,14 @@
 import os
+import re
+import json
 import bpy
 from . utils import *
+from . animation_cache import *
+from . bone_mapping import *
+from . skeleton_probe import read_skeleton
+from . keyframes import compress_action, find_root_bone, extract_root_motion, mark_loop
+
+BONE_MAP_FILE = "bone_map.json"
 
 
 def import_fbx(animation_file: str) -> bool:
@@ -39,32 +47,169 @@ def import_bvh(animation_file: str) -> bool:
     return False
 
 
+def load_bone_map() -> dict:
+    """
+    Load the user's bone name map from the user folder.  It maps source bone names to
+    destination bone names, or to "" to ignore a bone, eg. {"DEF-upper_arm.L.001": ""}
+    """
+    path = os.path.join(get_user_path(), BONE_MAP_FILE)
+    if os.path.exists(path):
+        try:
+            with open(path, "r") as file:
+                return json.load(file)
+        except (OSError, ValueError) as err:
+            print(f"Failed to load the bone map {path} (Error: {str(err)})")
+    return {}
+
+
+def get_bone_compatibility(src_bone_names, dst_arm) -> BoneCompatibility:
+    """
+    Match the bone names of an animation's source armature to the destination armature.
+    If the animations are from a different armature type (eg. Rigify vs Mixamo) the names
+    are translated, bones that can't be matched are reported as missing
+    """
+    return check_bone_compatibility(src_bone_names, [bone.name for bone in dst_arm.data.bones], load_bone_map())
+
+
 def verify_armatures(src_arm, dst_arm) -> bool:
     """
     Check the bone names of both armatures to ensure they match.  If the
     animations are from a different armature type (eg. Rigify vs Mixamo)
     then the bone names won't match and the animations won't work properly.
     """
-    # Get the list of source bone names
-    src_bone_names =  sorted(list(set([bone.name for bone in src_arm.pose.bones])))
-    dst_bone_names =  sorted(list(set([bone.name for bone in dst_arm.pose.bones])))
+    return get_bone_compatibility([bone.name for bone in src_arm.pose.bones], dst_arm).compatible
 
-    for bone_name in src_bone_names:
-        if bone_name not in dst_bone_names:
-            return False
 
-    return True
+def probe_animation(file_path: str, dst_arm) -> bool:
+    """
+    Check the skeleton in an animation file against the destination armature
+    without importing it.  Only returns False if the file could be read and
+    its bones don't match
+    """
+    bone_names = read_skeleton(file_path)
+    if bone_names is None:
+        return True
+    compatibility = get_bone_compatibility(bone_names, dst_arm)
+    if not compatibility.compatible:
+        print(f"{os.path.basename(file_path)}: {compatibility.summary()}")
+    return compatibility.compatible
 
 
-def remove_armature(arm) -> bool:
+def retarget_action(action, renamed: dict):
+    """
+    Point the fcurves of the action at the destination bones when their names differ
+    """
+    if not renamed:
+        return
+    for fcurve in action.fcurves:
+        match = re.match(r'pose\.bones\["(.+?)"\]', fcurve.data_path)
+        if match and match.group(1) in renamed:
+            bone_name = renamed[match.group(1)]
+            fcurve.data_path = f'pose.bones["{bone_name}"]{fcurve.data_path[match.end():]}'
+            if fcurve.group and fcurve.group.name == match.group(1):
+                fcurve.group.name = bone_name
+
+
+def remove_armature(arm) -> list:
     """
     Take the armature, find any other meshes that may be included
-    and remove them all
+    and remove them all.  Returns the (type, name) of the data the objects
+    leave behind so it can be cleaned up with purge_orphans
+    """
+    orphans = []
+    objects = [ob for ob in bpy.data.objects if ob.parent == arm] + [arm]
+    for ob in objects:
+        if ob.data:
+            orphans.append((ob.data.id_type, ob.data.name))
+        if ob.type == "MESH":
+            orphans.extend((material.id_type, material.name) for material in ob.data.materials if material)
+        bpy.data.objects.remove(ob)
+    return orphans
+
+
+def purge_orphans(orphans):
+    """
+    Remove the meshes, armatures and materials left behind by removed objects
+    if nothing else uses them
     """
-    for ob in bpy.data.objects:
-        if ob.parent == arm:
-            bpy.data.objects.remove(ob)
-    bpy.data.objects.remove(arm)
+    # Meshes and armatures go first as removing them frees up their materials
+    data_collections = (
+        ('MESH', bpy.data.meshes),
+        ('ARMATURE', bpy.data.armatures),
+        ('MATERIAL', bpy.data.materials),
+    )
+    for id_type, data_collection in data_collections:
+        for orphan_type, name in orphans:
+            data = data_collection.get(name) if orphan_type == id_type else None
+            if data and data.users == 0:
+                data_collection.remove(data)
+
+
+def convert_animation(file_path: str, orphans = None) -> bool:
+    """
+    Import an fbx or bvh file and keep only its action in the action library.  The data
+    left behind by the imported objects is purged straight away unless a list is
+    passed to collect it in
+    """
+    extension = file_path.lower().rsplit(".", 1)[-1]
+    if extension == "fbx" and not import_fbx(file_path):
+        return False
+    elif extension == "bvh" and not import_bvh(file_path):
+        return False
+
+    src_arm = bpy.context.active_object
+    action = src_arm.animation_data.action if src_arm and src_arm.animation_data else None
+    if action:
+        write_library_action(file_path, action, [bone.name for bone in src_arm.pose.bones])
+    if src_arm:
+        if orphans is None:
+            purge_orphans(remove_armature(src_arm))
+        else:
+            orphans.extend(remove_armature(src_arm))
+    if action:
+        bpy.data.actions.remove(action)
+
+    return action is not None
+
+
+def convert_animations(files, workers = 1) -> dict:
+    """
+    Convert the files that aren't in the action library yet.  With more than one
+    worker the files are split across background Blender processes (0: one per core)
+    """
+    pending = get_pending_files(files)
+    if not workers:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(pending)))
+
+    results = {"converted": 0, "cached": len(files) - len(pending), "failed": 0}
+    if workers > 1:
+        convert_animations_parallel(pending, workers)
+        for file_path in pending:
+            results["converted" if is_converted(file_path) else "failed"] += 1
+        return results
+
+    # The imported meshes and materials are purged once at the end instead of per clip
+    orphans = []
+    try:
+        for index, file_path in enumerate(pending):
+            status = "converted" if convert_animation(file_path, orphans) else "failed"
+            results[status] += 1
+            print(f"[{index + 1}/{len(pending)}] {status}: {os.path.basename(file_path)}")
+    finally:
+        purge_orphans(orphans)
+    return results
+
+
+def load_animation(file_path: str, name: str):
+    """
+    Get the action of an animation file from the action library, converting the
+    file first if it isn't there yet.  Returns None if the file couldn't be loaded
+    """
+    if not is_converted(file_path) and not convert_animation(file_path):
+        return None
+    return append_library_action(file_path, name)
+
 
 def edit_animation(caller, context):
         scene = bpy.context.scene
@@ -86,29 +231,32 @@ def edit_animation(caller, context):
         file_path = bpy.path.abspath(scene.edit_animation_file)
         name = os.path.basename(file_path).rsplit(".", 1)[0].lower()
 
-        # Import the armature from the animation file
-        if fbx and not import_fbx(file_path):
-            return {'FINISHED'}
-        elif bvh and not import_bvh(file_path):
+        # Check the skeleton before paying for the import of a new file
+        if not is_converted(file_path) and not probe_animation(file_path, dst_arm):
+            info("Failed to import animation.  The armature types and bone names must match")
             return {'FINISHED'}
 
-        # Select the new armature
-        src_arm = bpy.context.active_object
+        # Load the action from the library, importing the file the first time
+        action = load_animation(file_path, name)
+        if not action:
+            return {'FINISHED'}
 
-        # Ensure the bone names of the src and dst match.  Otherwise there will
-        # be weird issues where the animations don't work.  For example, we don't
-        # want to apply mixamo animations to a rigify armature or vice versa
-        if verify_armatures(src_arm, dst_arm):
-            # Update the name of the new animation
-            src_arm.animation_data.action.name = name
+        # Ensure the bones of the src can be matched to the dst.  Otherwise there
+        # will be weird issues where the animations don't work.  Mixamo and Rigify
+        # names are translated and the fcurves renamed to the dst bones
+        compatibility = get_bone_compatibility(get_library_bones(file_path), dst_arm)
+        if compatibility.compatible:
+            retarget_action(action, compatibility.renamed)
 
             # Load the animation in a way that is editable in the animation tab
-            dst_arm.animation_data.action = bpy.data.actions[name]
+            if not dst_arm.animation_data:
+                dst_arm.animation_data_create()
+            dst_arm.animation_data.action = action
         else:
-            info("Failed to import animation.  The armature types and bone names must match")
+            bpy.data.actions.remove(action)
+            info(f"Failed to import animation.  The armature types and bone names must match ({compatibility.summary()})")
 
         # Select the original armature again
-        bpy.data.objects.remove(src_arm)
         bpy.ops.object.select_all(action='DESELECT')
         dst_arm.select_set(True)
         bpy.context.view_layer.objects.active = dst_arm
@@ -116,6 +264,66 @@ def edit_animation(caller, context):
         return {'FINISHED'}
 
 
+def _import_animation(dst_arm, file_path: str, animations: NlaIndex) -> str:
+    """
+    Add the animation in the file to a new NLA track of the destination armature.
+    The index of the armature's animations is updated as we go so a whole folder
+    can be imported with one scan.  Returns 'imported', 'exists', 'failed' or 'mismatch'
+    """
+    name = os.path.basename(file_path).rsplit(".", 1)[0].lower()
+    if name in animations:
+        return "exists"
+
+    # Check the skeleton before paying for the import of a new file
+    if not is_converted(file_path) and not probe_animation(file_path, dst_arm):
+        return "mismatch"
+
+    # Load the action from the library, importing the file the first time
+    action = load_animation(file_path, name)
+    if not action:
+        return "failed"
+
+    # Ensure the bones of the src can be matched to the dst.  Otherwise there
+    # will be weird issues where the animations don't work.  Mixamo and Rigify
+    # names are translated and the fcurves renamed to the dst bones
+    compatibility = get_bone_compatibility(get_library_bones(file_path), dst_arm)
+    if not compatibility.compatible:
+        print(f"{os.path.basename(file_path)}: {compatibility.summary()}")
+        bpy.data.actions.remove(action)
+        return "mismatch"
+    retarget_action(action, compatibility.renamed)
+
+    # Play the clip in place and keep the travel for the game's character movement
+    scene = bpy.context.scene
+    if scene.extract_root_motion:
+        bone_name = scene.root_motion_bone or find_root_bone(action, dst_arm)
+        if bone_name:
+            distance = extract_root_motion(action, bone_name)
+            loop = mark_loop(action)
+            print(f"{name}: root motion {distance} on {bone_name}{' (loop)' if loop else ''}")
+
+    # Mocap clips have a key on every frame for every bone
+    if scene.compress_animations:
+        before, after = compress_action(action, scene.compress_tolerance)
+        print(f"{name}: {before} -> {after} keys")
+
+    # Create a new track and animation strip
+    dst_arm.select_set(True)
+    animations.add(name, action)
+    return "imported"
+
+
+def get_animation_files(folder: str) -> list:
+    """
+    Get the fbx and bvh files in a folder sorted by name
+    """
+    if not os.path.isdir(folder):
+        return []
+    return sorted(
+        os.path.join(folder, file) for file in os.listdir(folder)
+        if file.lower().endswith((".fbx", ".bvh")))
+
+
 def import_animations(caller, context):
     scene = bpy.context.scene
     dst_arm = bpy.context.active_object
@@ -134,50 +342,16 @@ def import_animations(caller, context):
         return {'FINISHED'}
 
     file_path = bpy.path.abspath(scene.animation_file)
-    name = os.path.basename(file_path).rsplit(".", 1)[0].lower()
 
-    # Get the list of animations that already exist in the destination
-    animations = []
-    if dst_arm.animation_data:
-        for track in dst_arm.animation_data.nla_tracks:
-            for animation in track.strips:
-                animations.append(animation.name)
+    status = _import_animation(dst_arm, file_path, NlaIndex(dst_arm))
 
-    if name in animations:
+    if status == "exists":
         info("An animation with that name already exists")
         return {'FINISHED'}
-
-    # Import the armature from the animation file
-    if fbx and not import_fbx(file_path):
-        return {'FINISHED'}
-    elif bvh and not import_bvh(file_path):
-        return {'FINISHED'}
-
-    # Select the new armature
-    src_arm = bpy.context.active_object
-
-    # Ensure the bone names of the src and dst match.  Otherwise there will
-    # be weird issues where the animations don't work.  For example, we don't
-    # want to apply mixamo animations to a rigify armature or vice versa
-    if verify_armatures(src_arm, dst_arm):
-        # Update the name of the new animation
-        src_arm.animation_data.action.name = name
-
-        # If no animation data exists create it
-        dst_arm.select_set(True)
-        if not dst_arm.animation_data:
-            dst_arm.animation_data_create()
-
-        # Create a new tack and animation strip
-        action = bpy.data.actions[name]
-        track = dst_arm.animation_data.nla_tracks.new()
-        track.name = f"track_{name}"
-        track.strips.new(name, 1, action)
-    else:
+    elif status == "mismatch":
         info("Failed to import animation.  The armature types and bone names must match")
 
     # Select the original armature again
-    remove_armature(src_arm)
     bpy.ops.object.select_all(action='DESELECT')
     dst_arm.select_set(True)
     bpy.context.view_layer.objects.active = dst_arm
@@ -185,6 +359,58 @@ def import_animations(caller, context):
     return {'FINISHED'}
 
 
+class WIZ_OT_import_animation_folder(bpy.types.Operator):
+    bl_label = "Simple operator"
+    bl_idname = "view3d.import_animation_folder"
+    bl_description = "Import every fbx and bvh animation in a folder onto the selected armature"
+
+    def execute(caller, context):
+        scene = bpy.context.scene
+        dst_arm = bpy.context.active_object
+        if not dst_arm or dst_arm.type != "ARMATURE":
+            info("Please select a destination armature")
+            return {'FINISHED'}
+
+        files = get_animation_files(bpy.path.abspath(scene.animation_folder))
+        if not files:
+            info("Please select a folder with fbx or bvh animation files")
+            return {'FINISHED'}
+
+        animations = NlaIndex(dst_arm)
+        results = {"imported": 0, "exists": 0, "failed": 0, "mismatch": 0}
+
+        # Check the skeletons of the new clips without importing them
+        new_files = [file_path for file_path in files if os.path.basename(file_path).rsplit(".", 1)[0].lower() not in animations]
+        mismatched = set(
+            file_path for file_path in new_files
+            if not is_converted(file_path) and not probe_animation(file_path, dst_arm))
+
+        # Convert the rest up front with background workers so the loop
+        # below only has to append the actions from the library
+        convert_animations([file_path for file_path in new_files if file_path not in mismatched], scene.animation_workers)
+
+        window_manager = bpy.context.window_manager
+        window_manager.progress_begin(0, len(files))
+        for index, file_path in enumerate(files):
+            status = "mismatch" if file_path in mismatched else _import_animation(dst_arm, file_path, animations)
+            results[status] += 1
+            print(f"[{index + 1}/{len(files)}] {status}: {os.path.basename(file_path)}")
+            window_manager.progress_update(index + 1)
+        window_manager.progress_end()
+
+        # Select the original armature again
+        bpy.ops.object.select_all(action='DESELECT')
+        dst_arm.select_set(True)
+        bpy.context.view_layer.objects.active = dst_arm
+
+        info(
+            f"Imported {results['imported']} animations.  {results['exists']} already existed, "
+            f"{results['mismatch']} had different bone names and {results['failed']} failed to load",
+            title = "Animations")
+
+        return {'FINISHED'}
+
+
 class WIZ_OT_play_animation(bpy.types.Operator):
     bl_label = "Simple operator"
     bl_idname = "view3d.play_animation"
@@ -0,0 +1,239 @@
+import os
+import json
+import time
+import subprocess
+from contextlib import ExitStack
+import bpy
+from . utils import *
+from . wiz_utils import StateSnapshot, ExportSkipped, _export_glb, remove_unused_actions
+from . profiling import profile_session, profile_phase
+from . textures import get_texture_settings
+
+REPORT_FILE = "batch_export_report.json"
+WORKER_FOLDER = "export_workers"
+
+
+def get_exportable_collections(layer_collection = None):
+    """
+    Walk the view layer and return every visible collection that directly holds
+    objects.  An exported collection includes the objects of its child collections
+    so they aren't exported again on their own.  Excluded or hidden collections are
+    skipped along with their children
+    """
+    if layer_collection is None:
+        layer_collection = bpy.context.view_layer.layer_collection
+
+    collections = []
+    for child in layer_collection.children:
+        if child.exclude or child.hide_viewport:
+            continue
+        if any(not ob.hide_viewport for ob in child.collection.objects):
+            collections.append(child.collection)
+        else:
+            collections.extend(get_exportable_collections(child))
+    return collections
+
+
+def _has_mixed_objects(collection):
+    # Same rule as the collection export button.  Armatures can't be exported
+    # together with unparented meshes
+    arm_exists = False
+    non_arm_exists = False
+    for ob in collection.all_objects:
+        if ob.type == "ARMATURE":
+            arm_exists = True
+        elif ob.type == "MESH" and ob.parent == None:
+            non_arm_exists = True
+    return arm_exists and non_arm_exists
+
+
+def export_collections(collections, results = None):
+    """
+    Export each collection to its prefab destination.  The scene is prepared once
+    for the whole batch instead of once per asset, and a failing asset is recorded
+    without stopping the rest.  Returns a list with one result per collection
+    """
+    if results is None:
+        results = []
+
+    scene = bpy.context.scene
+    set_object_mode()
+    state = StateSnapshot()
+
+    with profile_session(), lookup_cache():
+        # One time scene setup shared by every export in the batch
+        remove_unused_actions()
+
+        for collection in collections:
+            start = time.perf_counter()
+            result = {
+                "blend": bpy.data.filepath,
+                "collection": collection.name,
+                "destination": "",
+                "status": "exported",
+                "message": "",
+            }
+            try:
+                if _has_mixed_objects(collection):
+                    result["status"] = "skipped"
+                    result["message"] = "Armature objects can't be exported with non-armature objects"
+                else:
+                    with profile_phase("selection"):
+                        for ob in bpy.context.selected_objects:
+                            ob.select_set(False)
+                        for ob in collection.all_objects:
+                            ob.select_set(True)
+
+                    result["destination"] = get_godot_prefabs_path(collection, True, f"{collection.name.lower()}.glb")
+                    extension = get_texture_settings(result["destination"])[1]
+                    result["destination"] = f"{os.path.splitext(result['destination'])[0]}.{extension}"
+                    if not _export_glb(scene, collection, collection, True, purge_actions=False):
+                        result["status"] = "unchanged"
+            except ExportSkipped as err:
+                result["status"] = "skipped"
+                result["message"] = str(err)
+            except Exception as err:
+                result["status"] = "failed"
+                result["message"] = str(err)
+            result["seconds"] = round(time.perf_counter() - start, 3)
+            results.append(result)
+            print(f"[{result['status']}] {collection.name} ({result['seconds']}s) {result['message']}")
+
+    state.Restore()
+    return results
+
+
+def export_collections_parallel(collections, workers = 0, force = False):
+    """
+    Split the collections across background Blender processes that each open the saved
+    blend file and export their share.  A worker that crashes only fails its own
+    collections.  Returns the merged results of all workers
+    """
+    if not workers:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(collections)))
+
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "headless.py")
+    folder = os.path.join(get_user_path(), WORKER_FOLDER)
+    os.makedirs(folder, exist_ok=True)
+
+    # Deal the collections out round robin so big and small assets are spread evenly
+    shards = [collections[index::workers] for index in range(workers)]
+
+    results = []
+    with ExitStack() as stack:
+        processes = []
+        for index, shard in enumerate(shards):
+            report = os.path.join(folder, f"worker_{index}.json")
+            log = os.path.join(folder, f"worker_{index}.log")
+            if os.path.exists(report):
+                os.remove(report)
+
+            command = [
+                bpy.app.binary_path,
+                "--background",
+                "--factory-startup",
+                bpy.data.filepath,
+                "--python", script,
+                "--",
+                "export",
+                "--report", report,
+                "--collections", *[collection.name for collection in shard]]
+            if force:
+                command.append("--force")
+
+            log_file = stack.enter_context(open(log, "w"))
+            process = subprocess.Popen(command, stdout=log_file, stderr=subprocess.STDOUT)
+            processes.append((process, shard, report, log))
+
+        for process, shard, report, log in processes:
+            return_code = process.wait()
+
+            worker_results = []
+            if os.path.exists(report):
+                with open(report, "r") as file:
+                    worker_results = json.load(file)["results"]
+                for result in worker_results:
+                    result["log"] = log
+
+            # Anything the worker didn't report on failed with the worker
+            reported = set(result["collection"] for result in worker_results)
+            for collection in shard:
+                if collection.name not in reported:
+                    worker_results.append({
+                        "blend": bpy.data.filepath,
+                        "collection": collection.name,
+                        "destination": "",
+                        "status": "failed",
+                        "message": f"Export worker exited with code {return_code}",
+                        "seconds": 0,
+                        "log": log,
+                    })
+            results.extend(worker_results)
+
+    return results
+
+
+def write_report(results, path, seconds = None):
+    """
+    Write the batch results and a small summary to a json file.  seconds is the wall
+    clock time of the batch, by default the time of the results added together
+    """
+    summary = {}
+    for result in results:
+        summary[result["status"]] = summary.get(result["status"], 0) + 1
+    if seconds is None:
+        seconds = sum(result["seconds"] for result in results)
+    summary["seconds"] = round(seconds, 3)
+
+    create_folders(path)
+    with open(path, "w") as file:
+        json.dump({"summary": summary, "results": results}, file, indent=2)
+    return summary
+
+
+class WIZ_OT_export_glb_all(bpy.types.Operator):
+    bl_label = "Simple operator"
+    bl_idname = "view3d.export_glb_all"
+    bl_description = "Export every visible collection to Godot, one glb file per collection"
+
+    def execute(caller, context):
+        if not bpy.data.filepath:
+            info("Please save your blend file first")
+            return {'FINISHED'}
+
+        collections = get_exportable_collections()
+        if not collections:
+            info("No visible collections to export")
+            return {'FINISHED'}
+
+        start = time.perf_counter()
+        results = export_collections(collections)
+        summary = write_report(results, os.path.join(get_user_path(), REPORT_FILE), time.perf_counter() - start)
+        info(f"Exported {summary.get('exported', 0)} of {len(results)} collections in {summary['seconds']}s", title = "Export")
+
+        return {'FINISHED'}
+
+
+class WIZ_OT_export_glb_all_parallel(bpy.types.Operator):
+    bl_label = "Simple operator"
+    bl_idname = "view3d.export_glb_all_parallel"
+    bl_description = "Export every visible collection to Godot using several background Blender processes"
+
+    def execute(caller, context):
+        if not bpy.data.filepath or bpy.data.is_dirty:
+            info("Please save your blend file first")
+            return {'FINISHED'}
+
+        collections = get_exportable_collections()
+        if not collections:
+            info("No visible collections to export")
+            return {'FINISHED'}
+
+        scene = bpy.context.scene
+        start = time.perf_counter()
+        results = export_collections_parallel(collections, scene.export_workers, scene.force_export)
+        summary = write_report(results, os.path.join(get_user_path(), REPORT_FILE), time.perf_counter() - start)
+        info(f"Exported {summary.get('exported', 0)} of {len(results)} collections in {summary['seconds']}s", title = "Export")
+
+        return {'FINISHED'}
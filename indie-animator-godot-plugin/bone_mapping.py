@@ -0,0 +1,163 @@
+"""
+Match the bones of an animation's armature to a destination armature.  Names
+are compared after removing the prefixes other tools add and translating the
+Mixamo and Rigify names to the names of this add-on's armatures (BONE_NAME).
+This module doesn't use bpy so it can be used outside of Blender
+"""
+import re
+
+# Prefixes added by other tools that don't change which bone is meant
+BONE_PREFIXES = re.compile(r"^(mixamorig\d*:|DEF-)")
+
+# Mixamo names that differ from BONE_NAME.  The rest (Spine, LeftArm etc) are the same.
+# Bones this add-on's armatures don't have map to "" so they are ignored instead of
+# making every clip fail the compatibility check
+MIXAMO_BONES = {
+    "Hips": "Root",
+    "HeadTop_End": "",
+}
+
+# Rigify deform bone names.  spine.005 is the upper half of the neck
+RIGIFY_BONES = {
+    "spine": "Root",
+    "spine.001": "Spine",
+    "spine.002": "Spine1",
+    "spine.003": "Spine2",
+    "spine.004": "Neck",
+    "spine.005": "",
+    "spine.006": "Head",
+}
+
+for side, suffix in (("Left", "L"), ("Right", "R")):
+    MIXAMO_BONES.update({
+        f"{side}ToeBase": f"{side}Toe",
+        f"{side}Toe_End": "",
+        f"{side}HandThumb1": f"{side}Thumb1",
+        f"{side}HandThumb2": f"{side}Thumb2",
+        f"{side}HandThumb3": "",
+        f"{side}HandThumb4": "",
+        f"{side}HandIndex1": f"{side}Finger1",
+        f"{side}HandIndex2": f"{side}Finger2",
+        f"{side}HandIndex3": f"{side}Finger3",
+        f"{side}HandIndex4": "",
+    })
+    RIGIFY_BONES.update({
+        f"shoulder.{suffix}": f"{side}Shoulder",
+        f"upper_arm.{suffix}": f"{side}Arm",
+        f"forearm.{suffix}": f"{side}ForeArm",
+        f"hand.{suffix}": f"{side}Hand",
+        f"thumb.01.{suffix}": f"{side}Thumb1",
+        f"thumb.02.{suffix}": f"{side}Thumb2",
+        f"thumb.03.{suffix}": "",
+        f"f_index.01.{suffix}": f"{side}Finger1",
+        f"f_index.02.{suffix}": f"{side}Finger2",
+        f"f_index.03.{suffix}": f"{side}Finger3",
+        f"thigh.{suffix}": f"{side}UpLeg",
+        f"shin.{suffix}": f"{side}Leg",
+        f"foot.{suffix}": f"{side}Foot",
+        f"toe.{suffix}": f"{side}Toe",
+        f"pelvis.{suffix}": "",
+        f"breast.{suffix}": "",
+    })
+
+    # Twist bones, which Rigify splits the limbs into
+    for bone in ("upper_arm", "forearm", "thigh", "shin"):
+        RIGIFY_BONES[f"{bone}.{suffix}.001"] = ""
+
+    # The fingers the armatures don't have
+    for finger in ("Middle", "Ring", "Pinky"):
+        for joint in range(1, 5):
+            MIXAMO_BONES[f"{side}Hand{finger}{joint}"] = ""
+    for finger in ("f_middle", "f_ring", "f_pinky"):
+        for joint in range(1, 4):
+            RIGIFY_BONES[f"{finger}.0{joint}.{suffix}"] = ""
+    for joint in range(1, 5):
+        RIGIFY_BONES[f"palm.0{joint}.{suffix}"] = ""
+
+BONE_MAPS = (MIXAMO_BONES, RIGIFY_BONES)
+
+
+class BoneCompatibility():
+    """
+    The result of matching the bones of a source armature to a destination armature.
+    matched maps each source bone to its destination bone, missing lists the source
+    bones without a destination and ignored the ones the bone maps say to skip
+    """
+    def __init__(self, matched, missing, ignored):
+        self.matched = matched
+        self.missing = missing
+        self.ignored = ignored
+
+    @property
+    def compatible(self):
+        return not self.missing
+
+    @property
+    def coverage(self):
+        total = len(self.matched) + len(self.missing)
+        return len(self.matched) / total if total else 1.0
+
+    @property
+    def renamed(self):
+        return {src: dst for src, dst in self.matched.items() if src != dst}
+
+    def summary(self, limit = 5):
+        text = f"{len(self.matched)} of {len(self.matched) + len(self.missing)} bones matched ({self.coverage:.0%})"
+        if self.missing:
+            text += f".  Missing: {', '.join(self.missing[:limit])}"
+            if len(self.missing) > limit:
+                text += f" and {len(self.missing) - limit} more"
+        return text
+
+
+def get_canonical_name(name, bone_map = None):
+    """
+    Translate a bone name to the name this add-on uses for that bone.  The user's bone
+    map is checked before and after removing prefixes and maps a bone to "" to ignore it
+    """
+    if bone_map and name in bone_map:
+        return bone_map[name]
+    name = BONE_PREFIXES.sub("", name)
+    if bone_map and name in bone_map:
+        return bone_map[name]
+    for table in BONE_MAPS:
+        if name in table:
+            return table[name]
+    return name
+
+
+def check_bone_compatibility(src_bone_names, dst_bone_names, bone_map = None):
+    """
+    Match every source bone to a destination bone.  Identical names match first and
+    the rest are matched by their canonical names, ignoring case.  Each destination
+    bone can only be matched once
+    """
+    src_bone_names = sorted(set(src_bone_names))
+    dst_names = set(dst_bone_names)
+    matched = {name: name for name in src_bone_names if name in dst_names}
+    used = set(matched.values())
+
+    dst_lookup = {}
+    for name in dst_bone_names:
+        canonical = get_canonical_name(name, bone_map)
+        if canonical:
+            dst_lookup.setdefault(canonical.lower(), name)
+
+    missing = []
+    ignored = []
+    for name in src_bone_names:
+        if name in matched:
+            continue
+        canonical = get_canonical_name(name, bone_map)
+        if not canonical:
+            ignored.append(name)
+            continue
+
+        dst_name = dst_lookup.get(canonical.lower())
+        if dst_name is None or dst_name in used:
+            missing.append(name)
+        else:
+            matched[name] = dst_name
+            used.add(dst_name)
+
+    return BoneCompatibility(matched, missing, ignored)
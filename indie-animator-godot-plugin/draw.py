@@ -1,6 +1,7 @@
 import os
 import bpy
 from dataclasses import dataclass
+from functools import lru_cache
 import numpy as np
 from random import randint
 from . utils import *
@@ -12,85 +13,93 @@ class Colour:
     b: float
     a: float
 
-def _set_pixel(image, x, y, colour):
+def _set_pixel(pixels, x, y, colour):
     """
     Set a particular pixel to the colour passed in
     """
-    offs = (x + int(y*image.generated_width)) * 4
-    image.pixels[offs:offs+4] = colour
+    pixels[y, x] = colour
 
 
 
-def _get_gradient(start, end, steps):
+# Breakpoints of a gradient as fractions of its length.  The samples are shared equally
+# between the segments, which stretches the dark and light ends of the ramp
+GRADIENT_STOPS = (0, 0.125, 0.5, 0.875, 1.0)
+
+def _get_gradient(start, end, steps, stops = GRADIENT_STOPS):
+    """
+    Returns a [steps, 1, 4] piecewise linear gradient from the start to the end colour.
+    Any number of stops and steps can be used.  The result is cached and read only
+    """
     if steps <= 1:
         return np.reshape(np.array([[start.r, start.g, start.b, start.a]]), [1, 1, 4])
-    data = np.array([[(end.r - start.r) * i / (steps - 1) + start.r,
-                     (end.g - start.g) * i / (steps - 1) + start.g,
-                     (end.b - start.b) * i / (steps - 1) + start.b,
-                     (end.a - start.a) * i / (steps - 1) + start.a]
-                    for i in range(steps)])
-
-    sub_steps = int(steps / 4)
-    start1 = data[0]
-    end1 = data[int(sub_steps * 0.5) - 1]
-    start2 = end1
-    end2 = data[int(sub_steps * 2) - 1]
-    start3 = end2
-    end3 = data[int(sub_steps * 3.5) - 1]
-    start4 = end3
-    end4 = data[sub_steps * 4 - 1]
-
-    data1 =  np.array([[(end1[0] - start1[0]) * i / (sub_steps - 1) + start1[0],
-                        (end1[1] - start1[1]) * i / (sub_steps - 1) + start1[1],
-                        (end1[2] - start1[2]) * i / (sub_steps - 1) + start1[2],
-                        (end1[3] - start1[3]) * i / (sub_steps - 1) + start1[3]]
-                    for i in range(sub_steps)])
-
-    data2 =  np.array([[(end2[0] - start2[0]) * i / (sub_steps - 1) + start2[0],
-                        (end2[1] - start2[1]) * i / (sub_steps - 1) + start2[1],
-                        (end2[2] - start2[2]) * i / (sub_steps - 1) + start2[2],
-                        (end2[3] - start2[3]) * i / (sub_steps - 1) + start2[3]]
-                    for i in range(sub_steps)])
-
-    data3 =  np.array([[(end3[0] - start3[0]) * i / (sub_steps - 1) + start3[0],
-                        (end3[1] - start3[1]) * i / (sub_steps - 1) + start3[1],
-                        (end3[2] - start3[2]) * i / (sub_steps - 1) + start3[2],
-                        (end3[3] - start3[3]) * i / (sub_steps - 1) + start3[3]]
-                    for i in range(sub_steps)])
-
-    data4 =  np.array([[(end4[0] - start4[0]) * i / (sub_steps - 1) + start4[0],
-                        (end4[1] - start4[1]) * i / (sub_steps - 1) + start4[1],
-                        (end4[2] - start4[2]) * i / (sub_steps - 1) + start4[2],
-                        (end4[3] - start4[3]) * i / (sub_steps - 1) + start4[3]]
-                    for i in range(sub_steps)])
-
-    colors = np.concatenate((data1, data2, data3, data4))
-    return np.reshape(colors, [steps, 1, 4])
-
-
-
-def _set_gradient_pixel(image, x, y, start_colour, end_colour, width, height):
+    return _get_cached_gradient(
+        (start.r, start.g, start.b, start.a),
+        (end.r, end.g, end.b, end.a),
+        steps,
+        tuple(stops))
+
+
+@lru_cache(maxsize=256)
+def _get_cached_gradient(start, end, steps, stops):
+    start = np.array(start, dtype=np.float64)
+    end = np.array(end, dtype=np.float64)
+    if stops == GRADIENT_STOPS and steps >= len(stops) - 1:
+        colours = _get_palette_gradient(start, end, steps, stops)
+    else:
+        # Custom stops, or too few samples to give every segment one.  Sample positions
+        # are mapped through the stops so each segment gets an equal share of the
+        # samples without repeating the colours where they join
+        positions = np.interp(np.linspace(0, 1, steps), np.linspace(0, 1, len(stops)), stops)
+        colours = (end - start) * positions[:, None] + start
+
+    colours = np.reshape(colours, [steps, 1, 4])
+    colours.flags.writeable = False
+    return colours
+
+
+def _get_palette_gradient(start, end, steps, stops):
     """
-    Set a group of pixels to the colour passed in
+    The ramp the palettes have always been drawn with, so existing palettes keep their
+    exact colours.  Each segment starts and ends on the colour of a full ramp at its
+    stops, so the colour repeats where segments join.  A segment with a single sample
+    takes its end colour so the last sample is always the end colour
+    """
+    # Colours of a full ramp at each stop
+    knots = np.array([max(int(steps * stop) - 1, 0) for stop in stops])
+    knot_colours = (end - start) * knots[:, None] / (steps - 1) + start
+
+    # Split the samples between the segments, giving any remainder to the first ones
+    segments = len(stops) - 1
+    counts = np.full(segments, steps // segments)
+    counts[:steps % segments] += 1
+
+    # Ramp between the stop colours of each segment
+    segment = np.repeat(np.arange(segments), counts)
+    offset = np.arange(steps) - np.repeat(np.cumsum(counts) - counts, counts)
+    length = np.repeat(counts - 1, counts)
+    blend = np.divide(offset, length, out=np.ones(steps), where=length > 0)
+    return (knot_colours[segment + 1] - knot_colours[segment]) * blend[:, None] + knot_colours[segment]
+
+
+def _set_gradient_pixel(pixels, x, y, start_colour, end_colour, width, height):
+    """
+    Set a group of pixels to a vertical gradient.  Returns the gradient so callers
+    can pick colours from it without reading the pixels back
     """
     data = _get_gradient(start_colour, end_colour, height)
-    for row in range(height):
-        next_colour = data[row].tolist()[0]
-        xoff = x
-        yoff = y + row
-        offs = (xoff + int(yoff*image.generated_width)) * 4
-        image.pixels[offs:offs+(4*width)] = next_colour * width
+    pixels[y:y + height, x:x + width] = data
+    return data
 
 
-def _clear_image(image, colour):
+def _clear_image(pixels, colour):
     """
     Set all pixels to the requested colour
     """
-    image.pixels[:] = colour * image.generated_width * image.generated_height
+    pixels[:] = colour
 
 
 def create_monochrome_gradient_pallet(
-    image,
+    pixels,
     primary,
     pixel_size
 ):
@@ -109,34 +118,34 @@ def create_monochrome_gradient_pallet(
         secondary.a = 1
 
     # Lower Left
-    add_column(0, 0, image, Colour(0.5, 0.5, 0.5, 1), Colour(0.15, 0.15, 0.15, 1), pixel_size)
-    add_column(0, 2, image, primary, secondary, pixel_size)
-    add_column(0, 4, image, secondary, primary, pixel_size)
-    add_column(0, 6, image, primary, white, pixel_size)
+    add_column(0, 0, pixels, Colour(0.5, 0.5, 0.5, 1), Colour(0.15, 0.15, 0.15, 1), pixel_size)
+    add_column(0, 2, pixels, primary, secondary, pixel_size)
+    add_column(0, 4, pixels, secondary, primary, pixel_size)
+    add_column(0, 6, pixels, primary, white, pixel_size)
     # Upper Left
-    add_column(8, 0, image, Colour(0.15, 0.15, 0.15, 1), Colour(0, 0, 0, 1), pixel_size)
-    add_column(8, 2, image, secondary, primary, pixel_size)
-    add_column(8, 4, image, primary, secondary, pixel_size)
-    add_column(8, 6, image, white, secondary, pixel_size)
+    add_column(8, 0, pixels, Colour(0.15, 0.15, 0.15, 1), Colour(0, 0, 0, 1), pixel_size)
+    add_column(8, 2, pixels, secondary, primary, pixel_size)
+    add_column(8, 4, pixels, primary, secondary, pixel_size)
+    add_column(8, 6, pixels, white, secondary, pixel_size)
     # Upper Right
-    add_column(8, 8, image, Colour(0.15, 0.15, 0.15, 1), Colour(0, 0, 0, 1), pixel_size)
-    add_column(8, 10, image, secondary, black, pixel_size)
-    add_column(8, 12, image, primary, black, pixel_size)
-    add_column(8, 14, image, white, primary, pixel_size)
+    add_column(8, 8, pixels, Colour(0.15, 0.15, 0.15, 1), Colour(0, 0, 0, 1), pixel_size)
+    add_column(8, 10, pixels, secondary, black, pixel_size)
+    add_column(8, 12, pixels, primary, black, pixel_size)
+    add_column(8, 14, pixels, white, primary, pixel_size)
     # Lower Right
     if scene.allow_transparency:
-        add_column(0, 8, image, Colour(0.15, 0.15, 0.15, 1), Colour(0, 0, 0, 1), pixel_size)
-        add_column(0, 10, image, lowa_secondary, lowa_black, pixel_size)
-        add_column(0, 12, image, lowa_primary, lowa_black, pixel_size)
-        add_column(0, 14, image, lowa_white, lowa_primary, pixel_size)
+        add_column(0, 8, pixels, Colour(0.15, 0.15, 0.15, 1), Colour(0, 0, 0, 1), pixel_size)
+        add_column(0, 10, pixels, lowa_secondary, lowa_black, pixel_size)
+        add_column(0, 12, pixels, lowa_primary, lowa_black, pixel_size)
+        add_column(0, 14, pixels, lowa_white, lowa_primary, pixel_size)
     else:
-        add_column(0, 8, image, Colour(0.15, 0.15, 0.15, 1), Colour(0, 0, 0, 1), pixel_size)
-        add_column(0, 10, image, secondary, white, pixel_size)
-        add_column(0, 12, image, primary, white, pixel_size)
-        add_column(0, 14, image, white, primary, pixel_size)
+        add_column(0, 8, pixels, Colour(0.15, 0.15, 0.15, 1), Colour(0, 0, 0, 1), pixel_size)
+        add_column(0, 10, pixels, secondary, white, pixel_size)
+        add_column(0, 12, pixels, primary, white, pixel_size)
+        add_column(0, 14, pixels, white, primary, pixel_size)
 
 def create_single_gradient_pallet(
-    image,
+    pixels,
     primary,
     secondary,
     pixel_size
@@ -155,34 +164,34 @@ def create_single_gradient_pallet(
         secondary.a = 1
 
     # Lower Left
-    add_column(0, 0, image, Colour(0.5, 0.5, 0.5, 1), Colour(0.15, 0.15, 0.15, 1), pixel_size)
-    add_column(0, 2, image, primary, secondary, pixel_size)
-    add_column(0, 4, image, secondary, primary, pixel_size)
-    add_column(0, 6, image, primary, white, pixel_size)
+    add_column(0, 0, pixels, Colour(0.5, 0.5, 0.5, 1), Colour(0.15, 0.15, 0.15, 1), pixel_size)
+    add_column(0, 2, pixels, primary, secondary, pixel_size)
+    add_column(0, 4, pixels, secondary, primary, pixel_size)
+    add_column(0, 6, pixels, primary, white, pixel_size)
     # Upper Left
-    add_column(8, 0, image, Colour(0.15, 0.15, 0.15, 1), Colour(0, 0, 0, 1), pixel_size)
-    add_column(8, 2, image, secondary, primary, pixel_size)
-    add_column(8, 4, image, primary, secondary, pixel_size)
-    add_column(8, 6, image, white, secondary, pixel_size)
+    add_column(8, 0, pixels, Colour(0.15, 0.15, 0.15, 1), Colour(0, 0, 0, 1), pixel_size)
+    add_column(8, 2, pixels, secondary, primary, pixel_size)
+    add_column(8, 4, pixels, primary, secondary, pixel_size)
+    add_column(8, 6, pixels, white, secondary, pixel_size)
     # Upper Right
-    add_column(8, 8, image, Colour(0.15, 0.15, 0.15, 1), Colour(0, 0, 0, 1), pixel_size)
-    add_column(8, 10, image, secondary, black, pixel_size)
-    add_column(8, 12, image, primary, black, pixel_size)
-    add_column(8, 14, image, white, primary, pixel_size)
+    add_column(8, 8, pixels, Colour(0.15, 0.15, 0.15, 1), Colour(0, 0, 0, 1), pixel_size)
+    add_column(8, 10, pixels, secondary, black, pixel_size)
+    add_column(8, 12, pixels, primary, black, pixel_size)
+    add_column(8, 14, pixels, white, primary, pixel_size)
     # Lower Right
     if scene.allow_transparency:
-        add_column(0, 8, image, Colour(0.15, 0.15, 0.15, 1), Colour(0, 0, 0, 1), pixel_size)
-        add_column(0, 10, image, lowa_secondary, lowa_black, pixel_size)
-        add_column(0, 12, image, lowa_primary, lowa_black, pixel_size)
-        add_column(0, 14, image, lowa_white, lowa_primary, pixel_size)
+        add_column(0, 8, pixels, Colour(0.15, 0.15, 0.15, 1), Colour(0, 0, 0, 1), pixel_size)
+        add_column(0, 10, pixels, lowa_secondary, lowa_black, pixel_size)
+        add_column(0, 12, pixels, lowa_primary, lowa_black, pixel_size)
+        add_column(0, 14, pixels, lowa_white, lowa_primary, pixel_size)
     else:
-        add_column(0, 8, image, Colour(0.15, 0.15, 0.15, 1), Colour(0, 0, 0, 1), pixel_size)
-        add_column(0, 10, image, secondary, white, pixel_size)
-        add_column(0, 12, image, primary, white, pixel_size)
-        add_column(0, 14, image, white, primary, pixel_size)
+        add_column(0, 8, pixels, Colour(0.15, 0.15, 0.15, 1), Colour(0, 0, 0, 1), pixel_size)
+        add_column(0, 10, pixels, secondary, white, pixel_size)
+        add_column(0, 12, pixels, primary, white, pixel_size)
+        add_column(0, 14, pixels, white, primary, pixel_size)
 
 def create_double_gradient_pallet(
-    image,
+    pixels,
     primary,
     secondary,
     third,
@@ -203,40 +212,40 @@ def create_double_gradient_pallet(
         third.a = 1
 
     # Lower Left
-    add_column(0, 0, image, Colour(0.5, 0.5, 0.5, 1), Colour(0.15, 0.15, 0.15, 1), pixel_size)
-    add_column(0, 2, image, third, secondary, pixel_size)
-    add_column(0, 4, image, primary, third, pixel_size)
-    add_column(0, 6, image, secondary, primary, pixel_size)
+    add_column(0, 0, pixels, Colour(0.5, 0.5, 0.5, 1), Colour(0.15, 0.15, 0.15, 1), pixel_size)
+    add_column(0, 2, pixels, third, secondary, pixel_size)
+    add_column(0, 4, pixels, primary, third, pixel_size)
+    add_column(0, 6, pixels, secondary, primary, pixel_size)
     # Upper Left
-    add_column(8, 0, image, Colour(0.15, 0.15, 0.15, 1), Colour(0, 0, 0, 1), pixel_size)
-    add_column(8, 2, image, secondary, primary, pixel_size)
-    add_column(8, 4, image, third, secondary, pixel_size)
-    add_column(8, 6, image, primary, third, pixel_size)
+    add_column(8, 0, pixels, Colour(0.15, 0.15, 0.15, 1), Colour(0, 0, 0, 1), pixel_size)
+    add_column(8, 2, pixels, secondary, primary, pixel_size)
+    add_column(8, 4, pixels, third, secondary, pixel_size)
+    add_column(8, 6, pixels, primary, third, pixel_size)
     # Upper Right
-    add_column(8, 8, image, Colour(0.15, 0.15, 0.15, 1), Colour(0, 0, 0, 1), pixel_size)
-    add_column(8, 10, image, secondary, black, pixel_size)
-    add_column(8, 12, image, third, black, pixel_size)
-    add_column(8, 14, image, primary, black, pixel_size)
+    add_column(8, 8, pixels, Colour(0.15, 0.15, 0.15, 1), Colour(0, 0, 0, 1), pixel_size)
+    add_column(8, 10, pixels, secondary, black, pixel_size)
+    add_column(8, 12, pixels, third, black, pixel_size)
+    add_column(8, 14, pixels, primary, black, pixel_size)
     # Lower Right
     if scene.allow_transparency:
-        add_column(0, 8, image, Colour(0.15, 0.15, 0.15, 1), Colour(0, 0, 0, 1), pixel_size)
-        add_column(0, 10, image, lowa_secondary, lowa_black, pixel_size)
-        add_column(0, 12, image, lowa_third, lowa_black, pixel_size)
-        add_column(0, 14, image, lowa_primary, lowa_black, pixel_size)
+        add_column(0, 8, pixels, Colour(0.15, 0.15, 0.15, 1), Colour(0, 0, 0, 1), pixel_size)
+        add_column(0, 10, pixels, lowa_secondary, lowa_black, pixel_size)
+        add_column(0, 12, pixels, lowa_third, lowa_black, pixel_size)
+        add_column(0, 14, pixels, lowa_primary, lowa_black, pixel_size)
     else:
-        add_column(0, 8, image, Colour(0.15, 0.15, 0.15, 1), Colour(0, 0, 0, 1), pixel_size)
-        add_column(0, 10, image, secondary, white, pixel_size)
-        add_column(0, 12, image, third, white, pixel_size)
-        add_column(0, 14, image, primary, white, pixel_size)
+        add_column(0, 8, pixels, Colour(0.15, 0.15, 0.15, 1), Colour(0, 0, 0, 1), pixel_size)
+        add_column(0, 10, pixels, secondary, white, pixel_size)
+        add_column(0, 12, pixels, third, white, pixel_size)
+        add_column(0, 14, pixels, primary, white, pixel_size)
 
-def get_pixel_colour(image, x, y):
-    colour = image.pixels[(y * image.generated_width + x) * 4 : (y * image.generated_width + x + 1) * 4]
+def get_pixel_colour(pixels, x, y):
+    colour = pixels[y, x]
     return Colour(colour[0], colour[1], colour[2], colour[3])
 
 def add_column(
     row,
     column,
-    image,
+    pixels,
     start_colour,
     end_colour,
     pixel_size
@@ -244,8 +253,8 @@ def add_column(
     height = pixel_size * 8
 
     # Draw the second column as a full gradient from dark to light
-    _set_gradient_pixel(
-        image,
+    gradient = _set_gradient_pixel(
+        pixels,
         (column * pixel_size) + pixel_size,
         row * pixel_size,
         start_colour,
@@ -254,23 +263,16 @@ def add_column(
         pixel_size * 8)
 
     # Get the corresponding colours from the gradient to fill in the full pixels in the first column
-    half_pixel = int(pixel_size/2)
-    qrtr_pixel = int(pixel_size/4)
     for i in range(8):
         # Make sure the colour you pick is the darkest one so for the bottom colours we pick the pixel at
         # the bottom and the top ones we pick the one at the top
         if i >= 4:
-            colour_start = get_pixel_colour(image, (column + 1) * pixel_size + half_pixel, (row * pixel_size) + (i + 1) * pixel_size - 1)
+            colour = gradient[(i + 1) * pixel_size - 1, 0]
         else:
-            colour_start = get_pixel_colour(image, (column + 1) * pixel_size + half_pixel, (row * pixel_size) + i * pixel_size)
-        _set_gradient_pixel(
-                image,
-                column * pixel_size,
-                (row * pixel_size) + (i * pixel_size),
-                colour_start,
-                colour_start,
-                pixel_size,
-                pixel_size)
+            colour = gradient[i * pixel_size, 0]
+        y = (row * pixel_size) + (i * pixel_size)
+        x = column * pixel_size
+        pixels[y:y + pixel_size, x:x + pixel_size] = colour
 
 
 def save_image(image, image_name):
@@ -327,21 +329,25 @@ def create_gradient_pallet(
             alpha=True,
             float_buffer=True)
 
-    _clear_image(image, [0, 0, 0, 1.0])
+    # Draw the whole pallet into one buffer and upload it to the image in one go
+    pixels = np.empty((image_height, image_width, 4), dtype=np.float32)
+    _clear_image(pixels, [0, 0, 0, 1.0])
 
     primary_colour = Colour(primary_colour[0], primary_colour[1], primary_colour[2], primary_colour[3])
 
     # Based on the number of colours we are dealing with create the appropriate colour pallette
     num_secondary_colurs = len(secondary_colours)
     if not secondary_colours:
-        create_monochrome_gradient_pallet(image, primary_colour, pixel_size)
+        create_monochrome_gradient_pallet(pixels, primary_colour, pixel_size)
     elif num_secondary_colurs == 1:
         secondary_colour = Colour(secondary_colours[0][0], secondary_colours[0][1], secondary_colours[0][2], secondary_colours[0][3])
-        create_single_gradient_pallet(image, primary_colour, secondary_colour, pixel_size)
+        create_single_gradient_pallet(pixels, primary_colour, secondary_colour, pixel_size)
     else:
         secondary_colour = Colour(secondary_colours[0][0], secondary_colours[0][1], secondary_colours[0][2], secondary_colours[0][3])
         third_colour = Colour(secondary_colours[1][0], secondary_colours[1][1], secondary_colours[1][2], secondary_colours[1][3])
-        create_double_gradient_pallet(image, primary_colour, secondary_colour, third_colour, pixel_size)
+        create_double_gradient_pallet(pixels, primary_colour, secondary_colour, third_colour, pixel_size)
+
+    image.pixels.foreach_set(pixels.ravel())
 
     return save_image(image, image_name)
 
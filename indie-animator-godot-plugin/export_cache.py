@@ -0,0 +1,313 @@
+import os
+import hashlib
+import numpy as np
+import bpy
+from . utils import *
+
+MANIFEST_FILE = "export_manifest.json"
+
+# Loaded manifests keyed by the manifest path so each Godot project keeps its own
+_manifests = {}
+
+# Entries written by this process, merged into the manifest file on every save
+_recorded = {}
+
+
+def _hash_values(hasher, *values):
+    hasher.update(repr(values).encode())
+
+
+def _hash_array(hasher, collection, attribute, size, dtype = np.float32):
+    """
+    Hash a property of every item in a bpy collection using a single foreach_get
+    """
+    data = np.empty(len(collection) * size, dtype=dtype)
+    collection.foreach_get(attribute, data)
+    hasher.update(data.tobytes())
+
+
+def _socket_value(socket):
+    value = getattr(socket, "default_value", None)
+    if value is None or isinstance(value, (int, float, str, bool)):
+        return value
+    try:
+        return tuple(value)
+    except TypeError:
+        return str(value)
+
+
+# Properties every node has.  Anything else a node type adds is one of its settings,
+# eg. a mix node's blend type or an image node's interpolation
+NODE_BASE_PROPERTIES = None
+
+
+def _node_settings(node):
+    global NODE_BASE_PROPERTIES
+    if NODE_BASE_PROPERTIES is None:
+        NODE_BASE_PROPERTIES = set(prop.identifier for prop in bpy.types.Node.bl_rna.properties)
+
+    settings = []
+    for prop in node.bl_rna.properties:
+        if prop.identifier in NODE_BASE_PROPERTIES or prop.type in ('POINTER', 'COLLECTION'):
+            continue
+        value = getattr(node, prop.identifier, None)
+        if prop.type == 'ENUM' and prop.is_enum_flag:
+            value = tuple(sorted(value))
+        elif getattr(prop, "is_array", False):
+            value = tuple(value)
+        settings.append((prop.identifier, value))
+
+    color_ramp = getattr(node, "color_ramp", None)
+    if color_ramp:
+        settings.append(("color_ramp", color_ramp.interpolation, [(element.position, tuple(element.color)) for element in color_ramp.elements]))
+    return settings
+
+
+def _custom_properties(id_data):
+    return sorted((key, repr(id_data[key])) for key in id_data.keys())
+
+
+def _hash_image(hasher, image):
+    _hash_values(hasher, image.name, image.source, tuple(image.size), image.filepath, image.colorspace_settings.name)
+    if image.packed_file:
+        hasher.update(image.packed_file.data)
+    elif image.source == 'FILE' and not image.is_dirty:
+        path = bpy.path.abspath(image.filepath)
+        if os.path.exists(path):
+            stat = os.stat(path)
+            _hash_values(hasher, stat.st_size, stat.st_mtime)
+    elif image.has_data:
+        pixels = np.empty(len(image.pixels), dtype=np.float32)
+        image.pixels.foreach_get(pixels)
+        hasher.update(pixels.tobytes())
+
+
+def _hash_material(hasher, material, images):
+    _hash_values(
+        hasher,
+        material.name,
+        tuple(material.diffuse_color),
+        material.metallic,
+        material.roughness,
+        material.blend_method,
+        material.use_backface_culling)
+    if not material.node_tree:
+        return
+
+    for node in material.node_tree.nodes:
+        _hash_values(hasher, node.name, node.bl_idname, _node_settings(node), [_socket_value(socket) for socket in node.inputs])
+        image = getattr(node, "image", None)
+        if image:
+            _hash_values(hasher, image.name, getattr(node, "interpolation", None))
+            images[image.name] = image
+    for link in material.node_tree.links:
+        _hash_values(
+            hasher,
+            link.from_node.name,
+            link.from_socket.identifier,
+            link.to_node.name,
+            link.to_socket.identifier)
+
+
+def _hash_mesh(hasher, mesh):
+    _hash_values(hasher, mesh.name, len(mesh.vertices), len(mesh.loops), len(mesh.polygons))
+    _hash_array(hasher, mesh.vertices, "co", 3)
+    _hash_array(hasher, mesh.loops, "vertex_index", 1, np.int32)
+    _hash_array(hasher, mesh.polygons, "loop_total", 1, np.int32)
+    _hash_array(hasher, mesh.polygons, "material_index", 1, np.int32)
+    _hash_array(hasher, mesh.polygons, "use_smooth", 1, bool)
+    for uv_layer in mesh.uv_layers:
+        _hash_values(hasher, uv_layer.name)
+        _hash_array(hasher, uv_layer.data, "uv", 2)
+    _hash_colors(hasher, mesh)
+    _hash_normals(hasher, mesh)
+    _hash_shape_keys(hasher, mesh)
+    _hash_values(hasher, _custom_properties(mesh))
+
+
+def _hash_colors(hasher, mesh):
+    # Colour attributes replaced the vertex colours in Blender 3.2
+    color_attributes = getattr(mesh, "color_attributes", None)
+    if color_attributes is None:
+        color_attributes = mesh.vertex_colors
+        _hash_values(hasher, color_attributes.active_index)
+    else:
+        _hash_values(hasher, color_attributes.active_color_index, color_attributes.render_color_index)
+    for attribute in color_attributes:
+        _hash_values(hasher, attribute.name, getattr(attribute, "domain", None), getattr(attribute, "data_type", None))
+        _hash_array(hasher, attribute.data, "color", 4)
+
+
+def _hash_normals(hasher, mesh):
+    _hash_values(hasher, mesh.has_custom_normals, getattr(mesh, "use_auto_smooth", None), getattr(mesh, "auto_smooth_angle", None))
+    if not mesh.has_custom_normals:
+        return
+
+    # From Blender 4.1 the normals are always up to date, before that they have to be calculated
+    if hasattr(mesh, "corner_normals"):
+        _hash_array(hasher, mesh.corner_normals, "vector", 3)
+    else:
+        mesh.calc_normals_split()
+        _hash_array(hasher, mesh.loops, "normal", 3)
+
+
+def _hash_shape_keys(hasher, mesh):
+    if not mesh.shape_keys:
+        return
+    _hash_values(hasher, mesh.shape_keys.use_relative)
+    for key_block in mesh.shape_keys.key_blocks:
+        _hash_values(
+            hasher,
+            key_block.name,
+            key_block.value,
+            key_block.mute,
+            key_block.slider_min,
+            key_block.slider_max,
+            key_block.relative_key.name,
+            key_block.vertex_group)
+        _hash_array(hasher, key_block.data, "co", 3)
+
+
+def _hash_vertex_groups(hasher, ob):
+    _hash_values(hasher, [group.name for group in ob.vertex_groups])
+
+    # The weights are gathered into arrays and hashed in one go
+    vertices = ob.data.vertices
+    elements = [vertex.groups for vertex in vertices]
+    counts = np.fromiter((len(groups) for groups in elements), dtype=np.int32, count=len(vertices))
+    total = int(counts.sum())
+    groups = np.fromiter((group.group for groups in elements for group in groups), dtype=np.int32, count=total)
+    weights = np.fromiter((group.weight for groups in elements for group in groups), dtype=np.float32, count=total)
+    hasher.update(counts.tobytes())
+    hasher.update(groups.tobytes())
+    hasher.update(weights.tobytes())
+
+
+def _hash_armature(hasher, armature):
+    _hash_values(hasher, armature.name, [(bone.name, bone.parent.name if bone.parent else "", bone.use_deform) for bone in armature.bones])
+    _hash_array(hasher, armature.bones, "head_local", 3)
+    _hash_array(hasher, armature.bones, "tail_local", 3)
+    _hash_array(hasher, armature.bones, "matrix_local", 16)
+
+
+def _hash_action(hasher, action):
+    _hash_values(hasher, action.name, tuple(action.frame_range), _custom_properties(action))
+    for fcurve in action.fcurves:
+        _hash_values(hasher, fcurve.data_path, fcurve.array_index, fcurve.mute, [modifier.type for modifier in fcurve.modifiers])
+        points = fcurve.keyframe_points
+        _hash_array(hasher, points, "co", 2)
+        _hash_array(hasher, points, "handle_left", 2)
+        _hash_array(hasher, points, "handle_right", 2)
+        _hash_values(hasher, [point.interpolation for point in points])
+
+
+def _get_actions(objects):
+    """
+    Gather the actions used by the objects either directly or through NLA strips
+    """
+    actions = {}
+    for ob in objects:
+        animation_data = ob.animation_data
+        if not animation_data:
+            continue
+        if animation_data.action:
+            actions[animation_data.action.name] = animation_data.action
+        for track in animation_data.nla_tracks:
+            for strip in track.strips:
+                if strip.action:
+                    actions[strip.action.name] = strip.action
+    return actions
+
+
+def get_export_fingerprint(objects, settings, actions = None):
+    """
+    Build a fingerprint of everything that ends up in an exported file.  This covers the
+    objects and their meshes, colours, normals, shape keys, vertex groups, materials,
+    images, armatures, NLA tracks and actions along with the export settings.  If no
+    actions are passed the ones used by the objects and their NLA tracks are hashed
+    """
+    hasher = hashlib.sha1()
+    _hash_values(hasher, sorted(settings.items()))
+
+    materials = {}
+    images = {}
+    for ob in sorted(objects, key=lambda ob: ob.name):
+        _hash_values(
+            hasher,
+            ob.name,
+            ob.type,
+            ob.parent.name if ob.parent else "",
+            ob.parent_bone,
+            [tuple(row) for row in ob.matrix_world],
+            [(modifier.name, modifier.type, modifier.show_viewport) for modifier in ob.modifiers],
+            _custom_properties(ob))
+
+        if ob.type == "MESH":
+            _hash_mesh(hasher, ob.data)
+            if ob.vertex_groups:
+                _hash_vertex_groups(hasher, ob)
+        elif ob.type == "ARMATURE":
+            _hash_armature(hasher, ob.data)
+
+        for slot in ob.material_slots:
+            if slot.material:
+                materials[slot.material.name] = slot.material
+
+        # When the actions are given only they matter, not how the NLA tracks are laid out
+        if ob.animation_data and actions is None:
+            _hash_values(
+                hasher,
+                ob.animation_data.action.name if ob.animation_data.action else "",
+                [
+                    (track.name, track.mute, [(strip.name, strip.action.name if strip.action else "", strip.frame_start, strip.frame_end, strip.scale, strip.repeat) for strip in track.strips])
+                    for track in ob.animation_data.nla_tracks
+                ])
+
+    for name in sorted(materials):
+        _hash_material(hasher, materials[name], images)
+    for name in sorted(images):
+        _hash_image(hasher, images[name])
+
+    if actions is None:
+        actions = _get_actions(objects)
+    for name in sorted(actions):
+        _hash_action(hasher, actions[name])
+
+    return hasher.hexdigest()
+
+
+def _get_manifest_path():
+    return os.path.join(get_user_path(), MANIFEST_FILE)
+
+
+def load_manifest():
+    """
+    Load the manifest of previous exports for the current Godot project
+    """
+    path = _get_manifest_path()
+    if path not in _manifests:
+        _manifests[path] = read_manifest(path)
+    return _manifests[path]
+
+
+def save_manifest():
+    """
+    Write the entries recorded by this process to the manifest.  Parallel export
+    workers share the same manifest so it is merged under a lock
+    """
+    path = _get_manifest_path()
+    _manifests[path] = update_manifest(path, _recorded.get(path, {}))
+
+
+def is_export_current(dest, fingerprint):
+    """
+    Returns True if the destination file exists and was exported from identical data
+    """
+    if bpy.context.scene.force_export:
+        return False
+    return os.path.exists(dest) and load_manifest().get(os.path.normpath(dest)) == fingerprint
+
+
+def record_export(dest, fingerprint):
+    _recorded.setdefault(_get_manifest_path(), {})[os.path.normpath(dest)] = fingerprint
+    save_manifest()
@@ -0,0 +1,133 @@
+"""
+Run Indie Animator jobs without the Blender interface, eg. from a nightly build
+
+    blender --background --python-exit-code 1 project.blend --python headless.py -- export
+    blender --background --python-exit-code 1 --python headless.py -- export --report out.json a.blend b.blend
+    blender --background --python-exit-code 1 project.blend --python headless.py -- export --workers 0
+    blender --background --python-exit-code 1 --python headless.py -- convert-animations --workers 0 clips/*.fbx
+
+When no blend files are passed the file Blender was started with is used.
+convert-animations imports fbx and bvh clips into the shared action library so
+the add-on can append them instead of importing them again.  This
+script is not part of the add-on registration, it loads the add-on package from
+the folder it lives in.
+"""
+import os
+import sys
+import time
+import argparse
+import importlib
+import importlib.util
+import bpy
+
+PACKAGE_NAME = "indie_animator_godot"
+
+
+def load_addon():
+    """
+    Import the add-on package from this folder and make sure its scene settings
+    are registered
+    """
+    if PACKAGE_NAME in sys.modules:
+        return sys.modules[PACKAGE_NAME]
+
+    folder = os.path.dirname(os.path.abspath(__file__))
+    spec = importlib.util.spec_from_file_location(
+        PACKAGE_NAME,
+        os.path.join(folder, "__init__.py"),
+        submodule_search_locations=[folder])
+    addon = importlib.util.module_from_spec(spec)
+    sys.modules[PACKAGE_NAME] = addon
+    spec.loader.exec_module(addon)
+
+    # The scene settings are registered by the panels.  If the add-on is already
+    # enabled in the user preferences they will exist already
+    if not hasattr(bpy.types.Scene, "scene_export_destination"):
+        addon.register()
+
+    return addon
+
+
+def parse_args(argv):
+    # Blender passes everything after "--" through to the script
+    argv = argv[argv.index("--") + 1:] if "--" in argv else []
+
+    parser = argparse.ArgumentParser(prog="headless.py")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export", help="Export every visible collection to Godot")
+    export.add_argument("blend_files", nargs="*", help="Blend files to export (default: the open file)")
+    export.add_argument("--report", default="", help="Path of the json summary report")
+    export.add_argument("--force", action="store_true", help="Export even if nothing changed since the last export")
+    export.add_argument("--collections", nargs="*", help="Only export the named collections")
+    export.add_argument("--workers", type=int, default=1, help="Number of Blender processes to export with (0: one per core)")
+
+    convert = commands.add_parser("convert-animations", help="Convert fbx and bvh files into the action library")
+    convert.add_argument("animation_files", nargs="+", help="Animation files to convert")
+    convert.add_argument("--workers", type=int, default=1, help="Number of Blender processes to convert with (0: one per core)")
+    convert.add_argument("--fps", type=int, default=0, help="Frame rate to convert the clips to (default: the scene's)")
+    convert.add_argument("--fps-base", type=float, default=1.0, help="Frame rate base to convert the clips to")
+
+    return parser.parse_args(argv)
+
+
+def export(args):
+    batch = importlib.import_module(f"{PACKAGE_NAME}.batch_export")
+    utils = importlib.import_module(f"{PACKAGE_NAME}.utils")
+
+    blend_files = args.blend_files or [bpy.data.filepath]
+    results = []
+    start = time.perf_counter()
+    for blend_file in blend_files:
+        if not blend_file:
+            print("No blend file to export")
+            continue
+        if os.path.abspath(blend_file) != os.path.abspath(bpy.data.filepath):
+            bpy.ops.wm.open_mainfile(filepath=blend_file)
+        bpy.context.scene.force_export = args.force
+
+        collections = batch.get_exportable_collections()
+        if args.collections is not None:
+            collections = [collection for collection in collections if collection.name in args.collections]
+
+        if args.workers == 1:
+            batch.export_collections(collections, results)
+        elif collections:
+            results.extend(batch.export_collections_parallel(collections, args.workers, args.force))
+
+    report = args.report or os.path.join(utils.get_user_path(), batch.REPORT_FILE)
+    summary = batch.write_report(results, report, time.perf_counter() - start)
+    print(f"Export summary: {summary} ({report})")
+
+    return summary.get("failed", 0) == 0
+
+
+def convert_animations(args):
+    animations = importlib.import_module(f"{PACKAGE_NAME}.animations")
+
+    if args.fps:
+        bpy.context.scene.render.fps = args.fps
+        bpy.context.scene.render.fps_base = args.fps_base
+
+    files = [os.path.abspath(file_path) for file_path in args.animation_files]
+    results = animations.convert_animations(files, args.workers)
+    print(f"Conversion summary: {results}")
+
+    return results["failed"] == 0
+
+
+def main():
+    args = parse_args(sys.argv)
+    load_addon()
+
+    success = True
+    if args.command == "export":
+        success = export(args)
+    elif args.command == "convert-animations":
+        success = convert_animations(args)
+
+    sys.exit(0 if success else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,347 @@
+import numpy as np
+import bpy
+from . utils import *
+
+# Rest values of the transform channels.  A channel that never leaves its rest
+# value doesn't change the pose and can be removed
+CHANNEL_DEFAULTS = {
+    "location": (0.0, 0.0, 0.0),
+    "rotation_euler": (0.0, 0.0, 0.0),
+    "rotation_quaternion": (1.0, 0.0, 0.0, 0.0),
+    "rotation_axis_angle": (0.0, 0.0, 1.0, 0.0),
+    "scale": (1.0, 1.0, 1.0),
+}
+
+# Axes of the root bone's location that are moved into the root motion.  For an upright
+# bone these are the ground plane as the bone's Y axis points up
+ROOT_MOTION_AXES = (0, 2)
+
+# How close the last frame has to be to the first for a clip to be marked as a loop
+LOOP_TOLERANCE = 0.01
+
+# Keyframe properties copied when the kept keys are packed together
+KEYFRAME_VECTORS = ("co", "handle_left", "handle_right")
+KEYFRAME_ENUMS = ("interpolation", "handle_left_type", "handle_right_type")
+
+
+def get_channel_default(data_path, index):
+    defaults = CHANNEL_DEFAULTS.get(data_path.rsplit(".", 1)[-1])
+    if defaults and index < len(defaults):
+        return defaults[index]
+    return None
+
+
+def read_keyframes(fcurve):
+    """
+    Read the frames and values of every key with a single foreach_get
+    """
+    co = np.empty(len(fcurve.keyframe_points) * 2, dtype=np.float64)
+    fcurve.keyframe_points.foreach_get("co", co)
+    co = co.reshape(-1, 2)
+    return co[:, 0], co[:, 1]
+
+
+def decimate_keys(frames, values, tolerance):
+    """
+    Find the keys needed to keep the curve within the tolerance of the original values
+    using Ramer-Douglas-Peucker.  Each segment is checked with a single numpy operation.
+    Returns a mask of the keys to keep
+    """
+    count = len(frames)
+    keep = np.zeros(count, dtype=bool)
+    keep[0] = keep[-1] = True
+
+    segments = [(0, count - 1)]
+    while segments:
+        start, end = segments.pop()
+        if end - start < 2:
+            continue
+
+        # Distance of the keys in between from the straight line joining the ends
+        t = (frames[start + 1:end] - frames[start]) / (frames[end] - frames[start])
+        error = np.abs(values[start + 1:end] - (values[start] + t * (values[end] - values[start])))
+        index = int(np.argmax(error))
+        if error[index] > tolerance:
+            split = start + 1 + index
+            keep[split] = True
+            segments.append((start, split))
+            segments.append((split, end))
+
+    return keep
+
+
+def _read_keyframe_data(points):
+    """
+    Read the properties of every key so the keys can be written back in any combination
+    """
+    data = {}
+    for attribute in KEYFRAME_VECTORS:
+        data[attribute] = np.empty(len(points) * 2, dtype=np.float32)
+        points.foreach_get(attribute, data[attribute])
+        data[attribute] = data[attribute].reshape(-1, 2)
+    for attribute in KEYFRAME_ENUMS:
+        data[attribute] = np.empty(len(points), dtype=np.int32)
+        points.foreach_get(attribute, data[attribute])
+    return data
+
+
+def _write_keyframes(fcurve, data, keep):
+    """
+    Replace the keys of the curve with the kept keys of the data.  Automatic handles
+    are worked out again for the new neighbours
+    """
+    points = fcurve.keyframe_points
+    kept = int(np.count_nonzero(keep))
+    if len(points) < kept:
+        points.add(kept - len(points))
+    while len(points) > kept:
+        points.remove(points[-1], fast=True)
+
+    for attribute in KEYFRAME_VECTORS:
+        points.foreach_set(attribute, data[attribute][keep].ravel())
+    for attribute in KEYFRAME_ENUMS:
+        points.foreach_set(attribute, data[attribute][keep])
+    fcurve.update()
+
+
+def _get_interpolation(points, name):
+    return points[0].bl_rna.properties["interpolation"].enum_items[name].value
+
+
+def _is_linear(points, interpolation):
+    # The last key's interpolation isn't used as there is nothing after it
+    return bool(np.all(interpolation[:-1] == _get_interpolation(points, "LINEAR")))
+
+
+def _bezier(p0, p1, p2, p3, t):
+    u = 1.0 - t
+    return u * u * u * p0 + 3.0 * u * u * t * p1 + 3.0 * u * t * t * p2 + t * t * t * p3
+
+
+def _evaluate_keyframes(fcurve, frames):
+    """
+    Evaluate the curve at the frames with numpy the way Blender does for constant,
+    linear and Bezier keys.  Frames between keys with any other interpolation are
+    evaluated by Blender
+    """
+    points = fcurve.keyframe_points
+    data = _read_keyframe_data(points)
+    co = data["co"].astype(np.float64)
+    left = data["handle_left"].astype(np.float64)
+    right = data["handle_right"].astype(np.float64)
+
+    segment = np.clip(np.searchsorted(co[:, 0], frames, side="right") - 1, 0, len(co) - 2)
+    x0, y0 = co[segment].T
+    x3, y3 = co[segment + 1].T
+    x1, y1 = right[segment].T
+    x2, y2 = left[segment + 1].T
+
+    # Like Blender, handles that overlap are shortened so the curve can't go back in time
+    length = x3 - x0
+    handles = np.abs(x1 - x0) + np.abs(x3 - x2)
+    scale = np.where(handles > length, length / np.maximum(handles, 1e-12), 1.0)
+    x1, y1 = x0 + (x1 - x0) * scale, y0 + (y1 - y0) * scale
+    x2, y2 = x3 + (x2 - x3) * scale, y3 + (y2 - y3) * scale
+
+    # x only increases along the segment so its t is found by halving the range
+    low = np.zeros_like(frames)
+    high = np.ones_like(frames)
+    for _ in range(40):
+        middle = (low + high) * 0.5
+        before = _bezier(x0, x1, x2, x3, middle) < frames
+        low = np.where(before, middle, low)
+        high = np.where(before, high, middle)
+    curve = _bezier(y0, y1, y2, y3, (low + high) * 0.5)
+
+    interpolation = data["interpolation"][segment]
+    ramp = (frames - x0) / np.maximum(length, 1e-12)
+    curve = np.where(interpolation == _get_interpolation(points, "LINEAR"), y0 + (y3 - y0) * ramp, curve)
+    curve = np.where(interpolation == _get_interpolation(points, "CONSTANT"), y0, curve)
+    curve = np.where(frames >= x3, y3, curve)
+
+    other = ~np.isin(interpolation, [_get_interpolation(points, name) for name in ("BEZIER", "LINEAR", "CONSTANT")])
+    for index in np.flatnonzero(other):
+        curve[index] = fcurve.evaluate(frames[index])
+    return curve
+
+
+def _fit_keyframes(fcurve, frames, values, tolerance):
+    """
+    Remove the keys the curve doesn't need.  The keys are first picked against straight
+    lines, which is exact for linear keys.  Other curves are checked against what they
+    evaluate to with the kept keys and handles, and the worst key of each segment that
+    is out of tolerance is put back until the whole curve is within it.  The curve is
+    evaluated with numpy while keys are put back and by Blender once to confirm it.
+    Returns the number of keys kept
+    """
+    points = fcurve.keyframe_points
+    keep = decimate_keys(frames, values, tolerance)
+    if keep.all():
+        return len(keep)
+
+    data = _read_keyframe_data(points)
+    _write_keyframes(fcurve, data, keep)
+    if _is_linear(points, data["interpolation"]):
+        return int(np.count_nonzero(keep))
+
+    confirm = False
+    while not keep.all():
+        if confirm:
+            curve = np.array([fcurve.evaluate(frame) for frame in frames])
+        else:
+            curve = _evaluate_keyframes(fcurve, frames)
+        error = np.abs(curve - values)
+        bad = np.flatnonzero((error > tolerance) & ~keep)
+        if not len(bad):
+            if confirm:
+                break
+            confirm = True
+            continue
+        confirm = False
+
+        # Put back the worst key between each pair of kept keys
+        segment = (np.cumsum(keep) - 1)[bad]
+        order = np.lexsort((-error[bad], segment))
+        _, first = np.unique(segment[order], return_index=True)
+        keep[bad[order[first]]] = True
+        _write_keyframes(fcurve, data, keep)
+
+    return int(np.count_nonzero(keep))
+
+
+def compress_action(action, tolerance):
+    """
+    Remove the keys that can be rebuilt from their neighbours within the tolerance of
+    the original values, whatever the keys' interpolation.  Channels that don't change
+    are reduced to one key, or removed if they stay at their rest value.  Returns the
+    number of keys before and after
+    """
+    before = 0
+    after = 0
+    for fcurve in list(action.fcurves):
+        count = len(fcurve.keyframe_points)
+        before += count
+        if count < 2 or fcurve.modifiers:
+            after += count
+            continue
+
+        frames, values = read_keyframes(fcurve)
+        if np.ptp(values) <= tolerance:
+            default = get_channel_default(fcurve.data_path, fcurve.array_index)
+            if default is not None and np.all(np.abs(values - default) <= tolerance):
+                action.fcurves.remove(fcurve)
+                continue
+            keep = np.zeros(count, dtype=bool)
+            keep[0] = True
+            _write_keyframes(fcurve, _read_keyframe_data(fcurve.keyframe_points), keep)
+            after += 1
+        else:
+            after += _fit_keyframes(fcurve, frames, values, tolerance)
+
+    return before, after
+
+
+def find_root_bone(action, arm):
+    """
+    Find the bone that moves the whole armature.  This is the top bone of the
+    hierarchy with animated location
+    """
+    candidates = [
+        bone for bone in arm.data.bones
+        if not bone.parent and action.fcurves.find(f'pose.bones["{bone.name}"].location')
+    ]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda bone: len(bone.children_recursive)).name
+
+
+def extract_root_motion(action, bone_name, axes = ROOT_MOTION_AXES):
+    """
+    Move the travel of the root bone along the axes out of the clip so it plays in place.
+    The offsets from the first frame are kept in the action's "root_motion" property for
+    the game to apply.  Returns the distance travelled along each axis
+    """
+    root_motion = {"bone": bone_name}
+    for index in axes:
+        fcurve = action.fcurves.find(f'pose.bones["{bone_name}"].location', index=index)
+        if not fcurve or len(fcurve.keyframe_points) < 2:
+            continue
+
+        points = fcurve.keyframe_points
+        frames, values = read_keyframes(fcurve)
+        offsets = values - values[0]
+
+        # Shift the keys and their handles back to the first frame's value
+        for attribute in KEYFRAME_VECTORS:
+            data = np.empty(len(points) * 2, dtype=np.float64)
+            points.foreach_get(attribute, data)
+            data[1::2] -= offsets
+            points.foreach_set(attribute, data)
+        fcurve.update()
+
+        root_motion["xyz"[index]] = {
+            "frames": frames.tolist(),
+            "offsets": offsets.tolist(),
+            "distance": float(offsets[-1]),
+        }
+
+    action["root_motion"] = root_motion
+    return {axis: root_motion[axis]["distance"] for axis in "xyz" if axis in root_motion}
+
+
+def mark_loop(action, tolerance = LOOP_TOLERANCE):
+    """
+    Mark the action as a cycle if every channel ends where it starts
+    """
+    start, end = action.frame_range
+    for fcurve in action.fcurves:
+        if abs(fcurve.evaluate(end) - fcurve.evaluate(start)) > tolerance:
+            return False
+
+    action.use_frame_range = True
+    action.frame_start = start
+    action.frame_end = end
+    action.use_cyclic = True
+    return True
+
+
+def get_nla_actions(arm):
+    """
+    Get the actions in the NLA strips of an armature, each one only once
+    """
+    actions = {}
+    if arm and arm.animation_data:
+        for track in arm.animation_data.nla_tracks:
+            for strip in track.strips:
+                if strip.action:
+                    actions[strip.action.name] = strip.action
+    return list(actions.values())
+
+
+class WIZ_OT_compress_animations(bpy.types.Operator):
+    bl_label = "Simple operator"
+    bl_idname = "view3d.compress_animations"
+    bl_description = "Remove the keyframes of the selected armature's animations that can be rebuilt within the tolerance"
+
+    def execute(caller, context):
+        arm = bpy.context.active_object
+        if not arm or arm.type != "ARMATURE":
+            info("Please select an armature")
+            return {'FINISHED'}
+
+        actions = get_nla_actions(arm)
+        if not actions:
+            info("The armature has no animations")
+            return {'FINISHED'}
+
+        tolerance = bpy.context.scene.compress_tolerance
+        before = 0
+        after = 0
+        for action in actions:
+            action_before, action_after = compress_action(action, tolerance)
+            print(f"{action.name}: {action_before} -> {action_after} keys")
+            before += action_before
+            after += action_after
+
+        info(f"Compressed {len(actions)} animations from {before} to {after} keys", title = "Animations")
+        return {'FINISHED'}
@@ -15,8 +15,23 @@ from enum import Enum
 from bpy.props import StringProperty, IntProperty, BoolProperty
 from bpy.types import UIList
 import uuid
+import numpy as np
 from . utils import *
 
+# How long the colour picker has to be still before the base texture is refilled
+FILL_DEBOUNCE_SECONDS = 0.15
+
+# Fill buffer reused between fills of the same length, keyed by its length.  Only the
+# latest length is kept and it is freed once the pending fills are done
+_fill_buffers = {}
+
+# The size and colour each image was last filled with, keyed by image pointer so an
+# image made again under the same name is never mistaken for the old one
+_fill_colours = {}
+
+# Colours waiting for the debounce timer, keyed by image name
+_pending_fills = {}
+
 
 def _get_id(ob):
     """
@@ -32,6 +47,51 @@ def _get_id(ob):
     return ob["id"]
 
 
+def _fill_image(image, colour):
+    """
+    Set every pixel of the image to the colour with a single foreach_set.  Nothing
+    is done if this image was last filled with the same colour at the same size
+    """
+    colour = tuple(colour)[:image.channels]
+    fill = (tuple(image.size), colour)
+    if _fill_colours.get(image.as_pointer()) == fill:
+        return
+
+    length = image.size[0] * image.size[1] * image.channels
+    buffer = _fill_buffers.get(length)
+    if buffer is None:
+        _fill_buffers.clear()
+        buffer = _fill_buffers[length] = np.empty(length, dtype=np.float32)
+    buffer.reshape(-1, image.channels)[:] = colour
+
+    image.pixels.foreach_set(buffer)
+    image.update()
+    _fill_colours[image.as_pointer()] = fill
+
+
+def _flush_pending_fills():
+    images = bpy.data.images
+    for name, colour in _pending_fills.items():
+        if name in images:
+            _fill_image(images[name], colour)
+    _pending_fills.clear()
+    _fill_buffers.clear()
+
+    # Returning None stops the timer
+    return None
+
+
+def _schedule_fill(image, colour):
+    """
+    Fill the image once the colour stops changing so dragging the colour picker
+    doesn't refill the whole texture on every step
+    """
+    _pending_fills[image.name] = tuple(colour)
+    if bpy.app.timers.is_registered(_flush_pending_fills):
+        bpy.app.timers.unregister(_flush_pending_fills)
+    bpy.app.timers.register(_flush_pending_fills, first_interval=FILL_DEBOUNCE_SECONDS)
+
+
 class WIZ_OT_base_normal_map(bpy.types.Operator):
     bl_label = "Simple operator"
     bl_idname = "view3d.generate_normal_map"
@@ -70,7 +130,7 @@ class WIZ_OT_base_normal_map(bpy.types.Operator):
         if image_file:
             texImage.image = bpy.data.images.load(image_file, check_existing=True)
         else:
-            image.pixels[:] = list(fill_colour) * image.generated_width * image.generated_height
+            _fill_image(image, fill_colour)
             texImage.image = image
 
         material.node_tree.links.new(bsdf.inputs['Base Color'], texImage.outputs['Color'])
@@ -363,9 +423,7 @@ def update_base_texture_settings(caller, context):
                 texImage.image = bpy.data.images.load(image_file, check_existing=True)
     else:
         if base_texture_name in images:
-            image = images[base_texture_name]
-            image.pixels[:] = list(fill_colour) * image.generated_width * image.generated_height
-            image.update()
+            _schedule_fill(images[base_texture_name], fill_colour)
 
 def update_material_settings(caller, context):
     bsdf = _get_bsdf()
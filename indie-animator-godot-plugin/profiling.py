@@ -0,0 +1,129 @@
+import os
+import csv
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+import bpy
+from . utils import *
+
+PROFILE_CSV_FILE = "export_profile.csv"
+PROFILE_FOLDER = "export_profiles"
+
+# Profiles of the most recent export run, shown in the export panel
+last_profiles = []
+
+# State of the current profiling run.  None when profiling is switched off
+_session = None
+
+
+class ExportProfile():
+    def __init__(self, name, phases):
+        self.name = name
+        self.destination = ""
+        self.phases = phases
+
+    @property
+    def seconds(self):
+        return sum(phase["seconds"] for phase in self.phases)
+
+    def slowest_phase(self):
+        if not self.phases:
+            return None
+        return max(self.phases, key=lambda phase: phase["seconds"])
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "destination": self.destination,
+            "seconds": round(self.seconds, 4),
+            "phases": self.phases,
+        }
+
+
+@contextmanager
+def profile_session():
+    """
+    Profile the exports run inside this block if profiling is enabled in the scene
+    """
+    global _session
+    if not bpy.context.scene.profile_exports:
+        yield
+        return
+
+    last_profiles.clear()
+    _session = {"pending": [], "asset": None}
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    try:
+        yield
+    finally:
+        if started_tracing:
+            tracemalloc.stop()
+        _session = None
+
+
+@contextmanager
+def profile_phase(name):
+    """
+    Record the wall time and python memory use of a block against the current asset.
+    Phases that run before an asset starts (eg. selection) are given to the next asset
+    """
+    if _session is None:
+        yield
+        return
+
+    start_memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        memory, peak_memory = tracemalloc.get_traced_memory()
+        phase = {
+            "phase": name,
+            "seconds": round(seconds, 4),
+            "memory_kb": round((memory - start_memory) / 1024, 1),
+            "peak_memory_kb": round((peak_memory - start_memory) / 1024, 1),
+        }
+        if _session["asset"]:
+            _session["asset"].phases.append(phase)
+        else:
+            _session["pending"].append(phase)
+
+
+def begin_asset_profile(name):
+    if _session is None:
+        return
+    _session["asset"] = ExportProfile(name, _session["pending"])
+    _session["pending"] = []
+
+
+def end_asset_profile(destination):
+    """
+    Finish the current asset and write its report.  The json report and a row per phase
+    in the csv go in the user folder so nothing is added to the Godot project
+    """
+    if _session is None or not _session["asset"]:
+        return
+    profile = _session["asset"]
+    profile.destination = destination
+    _session["asset"] = None
+    last_profiles.append(profile)
+
+    json_path = os.path.join(get_user_path(), PROFILE_FOLDER, f"{bpy.path.clean_name(profile.name)}.profile.json")
+    create_folders(json_path)
+    with open(json_path, "w") as file:
+        json.dump(profile.to_dict(), file, indent=2)
+
+    csv_path = os.path.join(get_user_path(), PROFILE_CSV_FILE)
+    write_header = not os.path.exists(csv_path)
+    with open(csv_path, "a", newline="") as file:
+        writer = csv.writer(file)
+        if write_header:
+            writer.writerow(["time", "asset", "destination", "phase", "seconds", "memory_kb", "peak_memory_kb"])
+        now = time.strftime("%Y-%m-%d %H:%M:%S")
+        for phase in profile.phases:
+            writer.writerow([now, profile.name, destination, phase["phase"], phase["seconds"], phase["memory_kb"], phase["peak_memory_kb"]])
@@ -0,0 +1,161 @@
+"""
+Read the bone names of an fbx or bvh file without importing it.  Only the
+skeleton part of the file is parsed so a clip can be checked against an
+armature before paying for the full import.  This module doesn't use bpy so
+it can be used outside of Blender
+
+    python skeleton_probe.py walk.fbx run.bvh
+"""
+import re
+import sys
+import struct
+
+FBX_BINARY_MAGIC = b"Kaydara FBX Binary  \x00"
+
+# Model types the Blender importer turns into bones.  Some exporters make the top bone a Root
+FBX_BONE_TYPES = ("LimbNode", "Limb", "Root")
+
+# Size of the values of the fixed size fbx property types
+FBX_PROPERTY_SIZES = {b"Y": 2, b"C": 1, b"I": 4, b"F": 4, b"D": 8, b"L": 8}
+
+FBX_ASCII_MODEL = re.compile(r'^\s*Model:\s*(?:-?\d+\s*,\s*)?"Model::(.*?)"\s*,\s*"(\w+)"')
+
+
+def read_bvh_bones(file_path):
+    """
+    Get the joint names from the HIERARCHY section of a bvh file
+    """
+    bones = []
+    with open(file_path, "r", errors="replace") as file:
+        for line in file:
+            tokens = line.split(None, 1)
+            if not tokens:
+                continue
+            if tokens[0] == "MOTION":
+                break
+            if tokens[0] in ("ROOT", "JOINT") and len(tokens) > 1:
+                bones.append(tokens[1].strip())
+    return bones or None
+
+
+def read_fbx_ascii_bones(file_path):
+    """
+    Get the names of the bone models from an ascii fbx file
+    """
+    bones = []
+    with open(file_path, "r", errors="replace") as file:
+        for line in file:
+            match = FBX_ASCII_MODEL.match(line)
+            if match and match.group(2) in FBX_BONE_TYPES:
+                bones.append(match.group(1))
+    return bones or None
+
+
+def _read_fbx_node(file, wide):
+    """
+    Read a node record header.  Returns the end offset, property count, property
+    length and name, or None for the null record that ends a list of nodes
+    """
+    if wide:
+        header = file.read(25)
+        if len(header) < 25:
+            return None
+        end_offset, num_properties, property_length, name_length = struct.unpack("<QQQB", header)
+    else:
+        header = file.read(13)
+        if len(header) < 13:
+            return None
+        end_offset, num_properties, property_length, name_length = struct.unpack("<IIIB", header)
+    if end_offset == 0:
+        return None
+    return end_offset, num_properties, property_length, file.read(name_length)
+
+
+def _read_fbx_properties(data, count):
+    """
+    Parse the properties of a node.  Strings are returned as bytes, arrays and raw
+    data are skipped as the models only use plain values
+    """
+    properties = []
+    offset = 0
+    for _ in range(count):
+        kind = data[offset:offset + 1]
+        offset += 1
+        if kind in FBX_PROPERTY_SIZES:
+            size = FBX_PROPERTY_SIZES[kind]
+            properties.append(data[offset:offset + size])
+            offset += size
+        elif kind in (b"S", b"R"):
+            length, = struct.unpack_from("<I", data, offset)
+            properties.append(data[offset + 4:offset + 4 + length])
+            offset += 4 + length
+        elif kind in (b"f", b"d", b"l", b"i", b"b"):
+            _, _, length = struct.unpack_from("<III", data, offset)
+            properties.append(None)
+            offset += 12 + length
+        else:
+            raise ValueError(f"Unknown fbx property type {kind}")
+    return properties
+
+
+def read_fbx_binary_bones(file_path):
+    """
+    Get the names of the bone models from a binary fbx file.  Only the Objects node is
+    read, every other node is skipped using its end offset
+    """
+    bones = []
+    with open(file_path, "rb") as file:
+        if file.read(len(FBX_BINARY_MAGIC)) != FBX_BINARY_MAGIC:
+            return None
+        file.read(2)
+        version, = struct.unpack("<I", file.read(4))
+
+        # From 7.5 the record offsets and counts are 64 bit
+        wide = version >= 7500
+
+        while True:
+            node = _read_fbx_node(file, wide)
+            if not node:
+                break
+            end_offset, _, property_length, name = node
+            if name != b"Objects":
+                file.seek(end_offset)
+                continue
+
+            file.seek(property_length, 1)
+            while file.tell() < end_offset:
+                child = _read_fbx_node(file, wide)
+                if not child:
+                    break
+                child_end, num_properties, child_property_length, child_name = child
+                if child_name == b"Model":
+                    properties = _read_fbx_properties(file.read(child_property_length), num_properties)
+                    if len(properties) >= 3 and properties[2] and properties[2].decode(errors="replace") in FBX_BONE_TYPES:
+                        # Names are stored as "Name\x00\x01Model"
+                        bones.append(properties[1].split(b"\x00\x01")[0].decode(errors="replace"))
+                file.seek(child_end)
+            break
+
+    return bones or None
+
+
+def read_skeleton(file_path):
+    """
+    Get the bone names of an fbx or bvh file.  Returns None if the file couldn't be read
+    """
+    try:
+        extension = file_path.lower().rsplit(".", 1)[-1]
+        if extension == "bvh":
+            return read_bvh_bones(file_path)
+        if extension == "fbx":
+            with open(file_path, "rb") as file:
+                binary = file.read(len(FBX_BINARY_MAGIC)) == FBX_BINARY_MAGIC
+            return read_fbx_binary_bones(file_path) if binary else read_fbx_ascii_bones(file_path)
+    except (OSError, ValueError, struct.error) as err:
+        print(f"Failed to read the skeleton of {file_path} (Error: {str(err)})")
+    return None
+
+
+if __name__ == "__main__":
+    for path in sys.argv[1:]:
+        print(f"{path}: {read_skeleton(path)}")
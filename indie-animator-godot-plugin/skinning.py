@@ -0,0 +1,236 @@
+import numpy as np
+import bpy
+from . utils import *
+
+# Most bones a vertex is weighted to.  Game engines including Godot only use four
+MAX_INFLUENCES = 4
+
+# How quickly a bone's weight drops off as it gets further away than the closest bone
+WEIGHT_FALLOFF = 4.0
+
+# Weights are rounded to this many steps so every vertex with the same weight for a
+# bone can be added to its vertex group in one call
+WEIGHT_STEPS = 255
+
+# Vertices measured against the bones at once.  Limits the memory of dense meshes
+CHUNK_SIZE = 16384
+
+
+def get_bone_segments(arm):
+    """
+    Get the names and world space heads and tails of the armature's deform bones
+    """
+    bones = [bone for bone in arm.data.bones if bone.use_deform]
+    matrix = np.array(arm.matrix_world, dtype=np.float64)
+    heads = np.array([bone.head_local for bone in bones], dtype=np.float64).reshape(-1, 3)
+    tails = np.array([bone.tail_local for bone in bones], dtype=np.float64).reshape(-1, 3)
+    heads = heads @ matrix[:3, :3].T + matrix[:3, 3]
+    tails = tails @ matrix[:3, :3].T + matrix[:3, 3]
+    return [bone.name for bone in bones], heads, tails
+
+
+def get_segment_distances(points, heads, tails):
+    """
+    Get the distance of every point to every bone segment as a (points, bones) array
+    """
+    direction = tails - heads
+    length = np.maximum(np.einsum("ij,ij->i", direction, direction), 1e-12)
+    distances = np.empty((len(points), len(heads)), dtype=np.float32)
+    for start in range(0, len(points), CHUNK_SIZE):
+        offset = points[start:start + CHUNK_SIZE, None, :] - heads[None, :, :]
+        t = np.clip(np.einsum("pbi,bi->pb", offset, direction) / length, 0.0, 1.0)
+        closest = offset - t[:, :, None] * direction[None, :, :]
+        distances[start:start + CHUNK_SIZE] = np.sqrt(np.einsum("pbi,pbi->pb", closest, closest))
+    return distances
+
+
+def get_distance_weights(distances, falloff = WEIGHT_FALLOFF):
+    """
+    Weight every bone by how much further away it is than the closest bone, so the
+    closest bone gets 1 and the weights fall off smoothly from there
+    """
+    distances = np.maximum(distances, 1e-6)
+    return (distances.min(axis = 1, keepdims = True) / distances) ** falloff
+
+
+def _relax_edges(surface, allowed, offsets, ends, lengths, vertices):
+    """
+    Shorten the surface distances of the neighbours of the vertices through them.
+    Returns the neighbours that got closer to any bone
+    """
+    counts = offsets[vertices + 1] - offsets[vertices]
+    index = np.repeat(offsets[vertices] - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+    sources = np.repeat(vertices, counts)
+    targets = ends[index]
+
+    # The shortest way into each neighbour from any of the vertices
+    order = np.argsort(targets, kind = "stable")
+    targets = targets[order]
+    candidate = surface[sources[order]] + lengths[index[order], None]
+    targets, first = np.unique(targets, return_index = True)
+    candidate = np.minimum.reduceat(candidate, first, axis = 0)
+
+    better = (candidate < surface[targets]) & allowed[targets]
+    changed = better.any(axis = 1)
+    targets = targets[changed]
+    surface[targets] = np.where(better[changed], candidate[changed], surface[targets])
+    return targets
+
+
+def get_surface_distances(co, edges, distances, max_influences = MAX_INFLUENCES, falloff = WEIGHT_FALLOFF):
+    """
+    Stop weights jumping across gaps such as between the legs.  Each bone spreads along
+    the edges from the vertices it is the closest bone of, and a vertex is given the
+    longer of its straight distance to the bone and the way it took over the surface.
+    Across a gap that is the long way round, anywhere else it is the straight distance.
+    The vertices that changed are worked on together with numpy in chunks until nothing
+    gets shorter.  A vertex is only measured against the bones that can be among its
+    strongest, which are its closest bones by straight distance as the result is never
+    shorter.  Bones a vertex can't reach that way get inf
+    """
+    count, bones = distances.shape
+    if not len(edges):
+        return distances
+
+    # Both directions of every edge sorted by their first vertex so the neighbours of
+    # a vertex are one slice
+    starts = np.concatenate((edges[:, 0], edges[:, 1]))
+    ends = np.concatenate((edges[:, 1], edges[:, 0]))
+    order = np.argsort(starts, kind = "stable")
+    starts = starts[order]
+    ends = ends[order]
+    offset = co[starts] - co[ends]
+    lengths = np.sqrt(np.einsum("ij,ij->i", offset, offset)).astype(np.float32)
+    offsets = np.concatenate(([0], np.cumsum(np.bincount(starts, minlength = count))))
+
+    allowed = np.ones((count, bones), dtype=bool)
+    if bones > max_influences:
+        allowed[:] = False
+        nearest = np.argpartition(distances, max_influences - 1, axis = 1)[:, :max_influences]
+        np.put_along_axis(allowed, nearest, True, axis = 1)
+    allowed &= get_distance_weights(distances, falloff) * WEIGHT_STEPS >= 0.5
+
+    # Every bone starts from the vertices it is closest to, or its closest vertex if it
+    # isn't the closest bone of any
+    vertices = np.arange(count)
+    closest = distances.argmin(axis = 1)
+    surface = np.full((count, bones), np.inf, dtype=np.float32)
+    surface[vertices, closest] = 0.0
+    for bone in np.setdiff1d(np.arange(bones), closest):
+        vertex = distances[:, bone].argmin()
+        surface[vertex, bone] = 0.0
+        allowed[vertex, bone] = True
+
+    frontier = vertices
+    while len(frontier):
+        changed = [
+            _relax_edges(surface, allowed, offsets, ends, lengths, frontier[start:start + CHUNK_SIZE])
+            for start in range(0, len(frontier), CHUNK_SIZE)
+        ]
+        frontier = np.unique(np.concatenate(changed))
+    return np.maximum(distances, surface)
+
+
+def limit_influences(weights, max_influences = MAX_INFLUENCES):
+    """
+    Keep the strongest weights of each vertex and scale them to add up to 1
+    """
+    if weights.shape[1] > max_influences:
+        weakest = np.argpartition(weights, -max_influences, axis = 1)[:, :-max_influences]
+        np.put_along_axis(weights, weakest, 0.0, axis = 1)
+    total = weights.sum(axis = 1, keepdims = True)
+    return np.divide(weights, total, out = np.zeros_like(weights), where = total > 0)
+
+
+def write_weights(ob, names, weights):
+    """
+    Replace the vertex groups of the bones with the weights.  Vertices are added in one
+    call per bone and rounded weight instead of one call per vertex
+    """
+    steps = np.rint(weights * WEIGHT_STEPS).astype(np.int32)
+    for bone, name in enumerate(names):
+        group = ob.vertex_groups.get(name)
+        if group:
+            ob.vertex_groups.remove(group)
+        group = ob.vertex_groups.new(name = name)
+
+        column = steps[:, bone]
+        indices = np.flatnonzero(column)
+        if not len(indices):
+            continue
+        order = np.argsort(column[indices], kind = "stable")
+        indices = indices[order]
+        values, starts = np.unique(column[indices], return_index = True)
+        for value, batch in zip(values, np.split(indices, starts[1:])):
+            group.add(batch.tolist(), float(value) / WEIGHT_STEPS, 'REPLACE')
+    return steps
+
+
+def _parent_to_armature(ob, arm):
+    """
+    Parent the mesh to the armature and deform it with an armature modifier, keeping
+    where the mesh is like parenting it in the viewport
+    """
+    matrix = ob.matrix_world.copy()
+    ob.parent = arm
+    ob.parent_type = 'OBJECT'
+    ob.matrix_parent_inverse = arm.matrix_world.inverted()
+    ob.matrix_world = matrix
+
+    for modifier in ob.modifiers:
+        if modifier.type == 'ARMATURE' and modifier.object == arm:
+            return
+    modifier = ob.modifiers.new(name = "Armature", type = 'ARMATURE')
+    modifier.object = arm
+
+
+def skin_mesh(ob, arm, surface = False):
+    """
+    Weight the mesh to the armature's deform bones by their distance, without Blender's
+    heat weighting.  With surface the distance is measured over the mesh.  Returns the
+    number of vertices each bone influences
+    """
+    names, heads, tails = get_bone_segments(arm)
+    coverage = {name: 0 for name in names}
+    _parent_to_armature(ob, arm)
+    if not names or not len(ob.data.vertices):
+        return coverage
+
+    co = get_world_vertex_coords(ob)
+    distances = get_segment_distances(co, heads, tails)
+    if surface:
+        edges = np.empty(len(ob.data.edges) * 2, dtype=np.int32)
+        ob.data.edges.foreach_get("vertices", edges)
+        distances = get_surface_distances(co, edges.reshape(-1, 2), distances)
+    weights = get_distance_weights(distances)
+    steps = write_weights(ob, names, limit_influences(weights))
+
+    for bone, name in enumerate(names):
+        coverage[name] = int(np.count_nonzero(steps[:, bone]))
+    return coverage
+
+
+def skin_meshes(arm, meshes, surface = False):
+    """
+    Weight each mesh to the armature and report how many vertices each bone influences
+    across all of them
+    """
+    coverage = {}
+    for ob in meshes:
+        for name, count in skin_mesh(ob, arm, surface).items():
+            coverage[name] = coverage.get(name, 0) + count
+
+    vertices = sum(len(ob.data.vertices) for ob in meshes)
+
+    # Every bone's count goes in one line of the log, the popup only has room for a summary
+    print("Vertices per bone: " + ", ".join(
+        f"{name} {count} ({count / vertices if vertices else 0:.0%})" for name, count in coverage.items()))
+
+    unused = [name for name, count in coverage.items() if not count]
+    message = f"Weighted {vertices} vertices to {len(coverage) - len(unused)} of {len(coverage)} bones"
+    if unused:
+        message += f".  No vertices: {', '.join(unused[:5])}"
+        if len(unused) > 5:
+            message += f" and {len(unused) - 5} more"
+    info(message, title = "Weights")
+    return coverage
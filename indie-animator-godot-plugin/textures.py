@@ -0,0 +1,222 @@
+import os
+import shutil
+import hashlib
+import numpy as np
+import bpy
+from . utils import *
+
+TEXTURE_CACHE_FOLDER = "texture_cache"
+TEXTURE_STAGING_FOLDER = "texture_staging"
+
+# Characters of the content hash used in texture names.  Image names are limited to
+# 63 characters and this is still far more than enough to tell textures apart
+TEXTURE_HASH_LENGTH = 20
+
+# Content hashes of image files keyed by path, size and time so unchanged files aren't read again
+_file_hashes = {}
+
+
+def get_image_hash(image):
+    """
+    Hash the contents of an image.  Returns None for images without any data
+    """
+    if image.packed_file:
+        return hashlib.sha1(image.packed_file.data).hexdigest()
+
+    path = bpy.path.abspath(image.filepath)
+    if image.source == 'FILE' and not image.is_dirty and os.path.exists(path):
+        stat = os.stat(path)
+        key = (os.path.normpath(path), stat.st_size, stat.st_mtime)
+        if key not in _file_hashes:
+            hasher = hashlib.sha1()
+            with open(path, "rb") as file:
+                for chunk in iter(lambda: file.read(1024 * 1024), b""):
+                    hasher.update(chunk)
+            _file_hashes[key] = hasher.hexdigest()
+        return _file_hashes[key]
+
+    if image.has_data:
+        pixels = np.empty(len(image.pixels), dtype=np.float32)
+        image.pixels.foreach_get(pixels)
+        return hashlib.sha1(pixels.tobytes()).hexdigest()
+    return None
+
+
+def get_image_nodes(objects):
+    """
+    Get the image texture nodes of the materials used by the objects
+    """
+    materials = {}
+    for ob in objects:
+        for slot in ob.material_slots:
+            if slot.material and slot.material.node_tree:
+                materials[slot.material.name] = slot.material
+    return [
+        node for material in materials.values() for node in material.node_tree.nodes
+        if node.type == 'TEX_IMAGE' and node.image
+    ]
+
+
+def get_texture_name(image_hash, colorspace, size = None):
+    """
+    Name a texture after its contents, colour space and size so textures with the same
+    name are always the same image, whatever blend file or asset they came from
+    """
+    name = f"{image_hash[:TEXTURE_HASH_LENGTH]}_{bpy.path.clean_name(colorspace)}"
+    if size:
+        name += f"_{size[0]}x{size[1]}"
+    return name
+
+
+def _get_copy(image, name):
+    # Another datablock for the same pixels.  Files are loaded again so nothing is
+    # read until the exporter needs it, packed and generated images are copied
+    copy = bpy.data.images.get(name)
+    if copy is None:
+        path = bpy.path.abspath(image.filepath)
+        if image.source == 'FILE' and not image.packed_file and not image.is_dirty and os.path.exists(path):
+            copy = bpy.data.images.load(path, check_existing=False)
+        else:
+            copy = image.copy()
+        copy.name = name
+    copy.colorspace_settings.name = image.colorspace_settings.name
+    copy.alpha_mode = image.alpha_mode
+    return copy
+
+
+def _get_proxy(image, image_hash, max_size):
+    """
+    Get the image the exporter writes for the image, named by get_texture_name.  Images
+    bigger than the max size are scaled down and saved to the user folder so they are
+    only made once.  Float images are saved as OpenEXR so HDR values aren't clamped
+    """
+    colorspace = image.colorspace_settings.name
+    width, height = image.size
+    if not max_size or max(width, height) <= max_size:
+        return _get_copy(image, get_texture_name(image_hash, colorspace))
+
+    scale = max_size / max(width, height)
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    name = get_texture_name(image_hash, colorspace, size)
+    file_format, extension = ('OPEN_EXR', "exr") if image.is_float else ('PNG', "png")
+    path = os.path.join(get_user_path(), TEXTURE_CACHE_FOLDER, f"{name}.{extension}")
+    if not os.path.exists(path):
+        scaled = image.copy()
+        scaled.scale(*size)
+        pixels = np.empty(size[0] * size[1] * 4, dtype=np.float32)
+        scaled.pixels.foreach_get(pixels)
+        bpy.data.images.remove(scaled)
+
+        proxy = bpy.data.images.new(name, size[0], size[1], alpha=True, float_buffer=image.is_float)
+        proxy.colorspace_settings.name = colorspace
+        proxy.pixels.foreach_set(pixels)
+        create_folders(path)
+        proxy.filepath_raw = path
+        proxy.file_format = file_format
+        proxy.save()
+        bpy.data.images.remove(proxy)
+
+    proxy = bpy.data.images.load(path, check_existing=True)
+    proxy.name = name
+    proxy.colorspace_settings.name = colorspace
+    return proxy
+
+
+def swap_textures(objects, max_size = 0):
+    """
+    Point every image node of the objects' materials at an image named after its
+    contents and colour space, scaled down to the max size.  Images with the same
+    contents are then only written once and images from different assets can't write
+    over each other.  Returns the swaps to pass to restore_textures
+    """
+    images = {}
+    swaps = []
+    for node in get_image_nodes(objects):
+        image = node.image
+        image_hash = get_image_hash(image)
+        if image_hash is None:
+            continue
+        key = (image_hash, image.colorspace_settings.name)
+        if key not in images:
+            images[key] = _get_proxy(image, image_hash, max_size)
+        swaps.append((node, image))
+        node.image = images[key]
+    return swaps
+
+
+def restore_textures(swaps):
+    """
+    Point the image nodes back at their own images and remove the images made for the
+    export, which nothing uses once the nodes are restored
+    """
+    swapped = {}
+    for node, image in swaps:
+        swapped[node.image.as_pointer()] = node.image
+        node.image = image
+    for image in swapped.values():
+        if image.users == 0:
+            bpy.data.images.remove(image)
+
+
+def _move_file(source, target):
+    # Moved next to the target first then renamed over it, so other processes only
+    # ever see the whole file even if the staging folder is on another drive
+    temp_path = f"{target}.{os.getpid()}.tmp"
+    shutil.move(source, temp_path)
+    os.replace(temp_path, target)
+
+
+def export_gltf(dest, settings):
+    """
+    Export the selected objects to the destination.  With shared textures the files are
+    exported to a staging folder of this process first.  Textures are named after their
+    contents, so one that is already in the textures folder is left alone.  The rest
+    and the glTF files are then moved into place with a rename so exports running at
+    the same time can't leave half written files
+    """
+    if settings.get("export_format") != 'GLTF_SEPARATE':
+        bpy.ops.export_scene.gltf(filepath=dest, **settings)
+        return
+
+    # Mirror the folders so the texture paths in the file are the same once moved
+    textures = get_godot_textures_path()
+    root = os.path.commonpath([os.path.dirname(dest), textures])
+    staging = os.path.join(get_user_path(), TEXTURE_STAGING_FOLDER, str(os.getpid()))
+    staged_dest = os.path.join(staging, os.path.relpath(dest, root))
+    staged_textures = os.path.join(staging, os.path.relpath(textures, root))
+    shutil.rmtree(staging, ignore_errors=True)
+    create_folders(staged_dest)
+    try:
+        bpy.ops.export_scene.gltf(filepath=staged_dest, **settings)
+
+        if os.path.isdir(staged_textures):
+            for name in os.listdir(staged_textures):
+                path = os.path.join(staged_textures, name)
+                if os.path.exists(os.path.join(textures, name)):
+                    os.remove(path)
+                else:
+                    _move_file(path, os.path.join(textures, name))
+
+        folder = os.path.dirname(staged_dest)
+        for name in os.listdir(folder):
+            path = os.path.join(folder, name)
+            if os.path.isfile(path):
+                _move_file(path, os.path.join(os.path.dirname(dest), name))
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+
+def get_texture_settings(dest):
+    """
+    Get the glTF settings for the scene's texture options.  Shared textures are written
+    once to the Godot textures folder instead of being embedded in every file, which
+    needs the separate glTF format.  Returns the settings and the file extension
+    """
+    scene = bpy.context.scene
+    settings = {"export_image_format": scene.texture_format}
+    if not scene.share_textures:
+        return settings, "glb"
+
+    settings["export_format"] = 'GLTF_SEPARATE'
+    settings["export_texture_dir"] = os.path.relpath(get_godot_textures_path(), os.path.dirname(dest)).replace("\\", "/")
+    return settings, "gltf"
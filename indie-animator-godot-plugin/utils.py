@@ -1,6 +1,34 @@
 import os
+import json
+import time
+import hashlib
+import numpy as np
 import bpy
 import addon_utils
+from contextlib import contextmanager
+
+TEXTURE_MANIFEST_FILE = "texture_manifest.json"
+
+# File extensions of Blender's image formats
+IMAGE_EXTENSIONS = {
+    'BMP': "bmp",
+    'IRIS': "rgb",
+    'PNG': "png",
+    'JPEG': "jpg",
+    'JPEG2000': "jp2",
+    'TARGA': "tga",
+    'TARGA_RAW': "tga",
+    'CINEON': "cin",
+    'DPX': "dpx",
+    'OPEN_EXR_MULTILAYER': "exr",
+    'OPEN_EXR': "exr",
+    'HDR': "hdr",
+    'TIFF': "tif",
+    'WEBP': "webp",
+}
+
+# Lookups cached for the duration of a lookup_cache() block.  None when no block is active
+_lookup_cache = None
 
 def info(message = "", title = "Warning", icon = 'INFO'):
 
@@ -43,28 +71,131 @@ def get_godot_textures_path(file = ""):
     return path
 
 
+def _get_packed_image_name(image):
+    # Named after the image, which is unique in the blend file, instead of the file it
+    # was packed from.  Blender's extension is kept if the name has one
+    stem, extension = os.path.splitext(image.name)
+    if extension[1:].lower() not in IMAGE_EXTENSIONS.values():
+        stem = image.name
+    extension = IMAGE_EXTENSIONS.get(image.file_format, image.file_format.lower())
+    return f"{bpy.path.clean_name(stem)}.{extension}"
+
+def _write_packed_image(image, manifest):
+    """
+    Write the packed data of an image to the Godot textures folder if it changed since the
+    last time it was written.  The image itself is left packed.  Returns the file path
+    """
+    path = os.path.normpath(get_godot_textures_path(_get_packed_image_name(image)))
+
+    # Reading the packed data makes a copy of it, so it is read once and the same bytes
+    # are hashed and written
+    data = image.packed_file.data
+    image_hash = hashlib.sha1(data).hexdigest()
+    if manifest.get(path) != image_hash or not os.path.exists(path):
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as file:
+            file.write(data)
+        os.replace(temp_path, path)
+        manifest[path] = image_hash
+    return path
+
 def get_texture_paths():
+    """
+    Returns the file paths of the images in use without changing the blend file.
+    Packed images are written to the Godot textures folder when their contents change
+    """
     images = [image for image in bpy.data.images if image.users > 0 and image.name != "Render Result"]
 
-    # Unpack images
+    manifest_path = os.path.join(get_user_path(), TEXTURE_MANIFEST_FILE)
+    manifest = read_manifest(manifest_path)
+    written = dict(manifest)
+
+    paths = []
     for image in images:
         if image.type == 'IMAGE' and image.packed_file:
-            image.unpack()
-
-    return [os.path.normpath(bpy.path.abspath(img.filepath)) for img in images]
-
-def get_user_path():
-    # Ensure the user folder exists
+            paths.append(_write_packed_image(image, manifest))
+        else:
+            paths.append(os.path.normpath(bpy.path.abspath(image.filepath)))
+
+    changed = {path: image_hash for path, image_hash in manifest.items() if written.get(path) != image_hash}
+    if changed:
+        update_manifest(manifest_path, changed)
+    return paths
+
+def get_addon_user_path(folder = ""):
+    # Ensure the add-on's user folder, or a folder in it, exists.  Anything kept here
+    # is shared by every Godot project
     path = os.path.join(
         bpy.utils.resource_path("USER").split("blender")[0],
         "darkplaygroundgames",
         "indieanimator",
-        os.path.basename(os.path.normpath(bpy.context.scene.scene_export_destination))
+        folder
     )
     if not os.path.exists(path):
         os.makedirs(path, exist_ok=True)
     return path
 
+def get_user_path():
+    # Ensure the user folder of the current Godot project exists
+    return get_addon_user_path(os.path.basename(os.path.normpath(bpy.context.scene.scene_export_destination)))
+
+@contextmanager
+def file_lock(path, timeout = 60):
+    """
+    Hold a lock file beside the path so processes take turns to change it.  A lock left
+    behind by a process that died is broken once it is older than the timeout
+    """
+    lock_path = f"{path}.lock"
+    while True:
+        try:
+            os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_path) > timeout:
+                    os.remove(lock_path)
+                    continue
+            except OSError:
+                continue
+            time.sleep(0.05)
+    try:
+        yield
+    finally:
+        try:
+            os.remove(lock_path)
+        except OSError:
+            pass
+
+def read_manifest(path):
+    """
+    Read a json manifest.  A missing or unreadable manifest is empty
+    """
+    if os.path.exists(path):
+        try:
+            with open(path, "r") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            pass
+    return {}
+
+def update_manifest(path, entries):
+    """
+    Merge the entries into a json manifest.  The manifest is re-read, merged and written
+    while holding its lock so entries written by other processes at the same time are
+    kept.  Returns the merged manifest
+    """
+    create_folders(path)
+    with file_lock(path):
+        manifest = read_manifest(path)
+        manifest.update(entries)
+
+        # Write to a temporary file first so an interrupted write can't corrupt the manifest
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as file:
+            json.dump(manifest, file, indent=1, sort_keys=True)
+        os.replace(temp_path, path)
+    return manifest
+
 def create_folders(path):
     folder = os.path.dirname(path)
     if not os.path.exists(folder):
@@ -83,10 +214,39 @@ def _get_collection_path(collection, target_collection, include_current_collecti
 
     return ""
 
-def _get_hierarchy(target_collection, include_current_collection):
-    if not bpy.context.scene.auto_godot_folder_setup:
-        return ""
+@contextmanager
+def lookup_cache():
+    """
+    Cache collection lookups for the duration of an operation such as an export run.
+    Changes to the collection hierarchy made inside the block are not picked up
+    """
+    global _lookup_cache
+    if _lookup_cache is not None:
+        yield
+        return
+
+    _lookup_cache = {}
+    try:
+        yield
+    finally:
+        _lookup_cache = None
+
+def _get_cached(key, build):
+    if _lookup_cache is None:
+        return build()
+    if key not in _lookup_cache:
+        _lookup_cache[key] = build()
+    return _lookup_cache[key]
+
+def _build_collection_parents():
+    # Map each collection to the collections it is a child of
+    parents = {collection.as_pointer(): [] for collection in bpy.data.collections}
+    for collection in bpy.data.collections:
+        for child in collection.children:
+            parents[child.as_pointer()].append(collection)
+    return parents
 
+def _scan_hierarchy(target_collection, include_current_collection):
     collections = [collection for collection in bpy.data.collections]
     path = ""
     for collection in collections:
@@ -96,6 +256,28 @@ def _get_hierarchy(target_collection, include_current_collection):
 
     return path
 
+def _get_hierarchy(target_collection, include_current_collection):
+    if not bpy.context.scene.auto_godot_folder_setup:
+        return ""
+
+    # The scene collection isn't part of the hierarchy
+    parents = _get_cached("collection_parents", _build_collection_parents)
+    if target_collection.as_pointer() not in parents:
+        return ""
+
+    # Walk up from the target to the top level collection
+    path = target_collection.name if include_current_collection else "/"
+    collection = target_collection
+    while parents[collection.as_pointer()]:
+        # A collection linked into several parents could give more than one path.  Fall
+        # back to searching every collection so the longest path wins as it always has
+        if len(parents[collection.as_pointer()]) > 1:
+            return _scan_hierarchy(target_collection, include_current_collection)
+        collection = parents[collection.as_pointer()][0]
+        path = f"{collection.name}/{path}"
+
+    return path
+
 def set_object_mode() -> str:
     """
     Sets the current mode to object mode.  Returns the last mode before we changed it.
@@ -153,6 +335,160 @@ def clear_transformations():
     bpy.ops.pose.armature_apply(selected=False)
     set_mode(last_mode)
 
+def get_world_vertex_coords(ob):
+    """
+    Get the world space positions of a mesh object's vertices as an (n, 3) array.  The
+    coordinates are read with a single foreach_get, including edits made in edit mode
+    """
+    if ob.mode == 'EDIT':
+        ob.update_from_editmode()
+    vertices = ob.data.vertices
+    co = np.empty(len(vertices) * 3, dtype=np.float32)
+    vertices.foreach_get("co", co)
+    matrix = np.array(ob.matrix_world, dtype=np.float64)
+    return co.reshape(-1, 3) @ matrix[:3, :3].T + matrix[:3, 3]
+
+def get_evaluated_bounds(ob):
+    """
+    Get the world space min and max corners of an object's geometry with its modifiers
+    applied, so a half modelled mesh with a mirror is measured whole.  Returns None for
+    objects without any vertices
+    """
+    if ob.mode == 'EDIT':
+        ob.update_from_editmode()
+    evaluated = ob.evaluated_get(bpy.context.evaluated_depsgraph_get())
+    mesh = evaluated.to_mesh()
+    try:
+        if mesh is None or not len(mesh.vertices):
+            return None
+        co = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+        mesh.vertices.foreach_get("co", co)
+    finally:
+        evaluated.to_mesh_clear()
+    matrix = np.array(evaluated.matrix_world, dtype=np.float64)
+    co = co.reshape(-1, 3) @ matrix[:3, :3].T + matrix[:3, 3]
+    return co.min(axis=0), co.max(axis=0)
+
+def get_world_bound_box(objects):
+    """
+    Get the world space min and max corners of the objects' bounding boxes.  The corners
+    of every object are transformed together with numpy, which stays fast for big levels
+    and includes the objects' modifiers.  Objects without geometry only add their origin.
+    Returns None when there are no objects
+    """
+    if not objects:
+        return None
+    corners = np.array([ob.bound_box for ob in objects], dtype=np.float64)
+    matrices = np.array([ob.matrix_world for ob in objects], dtype=np.float64)
+    corners = np.einsum("nij,nkj->nki", matrices[:, :3, :3], corners) + matrices[:, None, :3, 3]
+    return corners.min(axis=(0, 1)), corners.max(axis=(0, 1))
+
+# Settings copied when the NLA tracks are rebuilt.  The strip's frame range follows
+# from its start, action range, scale and repeat
+NLA_TRACK_PROPERTIES = ("name", "mute", "is_solo", "lock")
+NLA_STRIP_PROPERTIES = (
+    "action_frame_start",
+    "action_frame_end",
+    "scale",
+    "repeat",
+    "blend_type",
+    "blend_in",
+    "blend_out",
+    "use_auto_blend",
+    "extrapolation",
+    "influence",
+    "use_reverse",
+    "use_sync_length",
+    "mute",
+)
+
+class NlaIndex():
+    """
+    The NLA strips of an armature by name.  The tracks are scanned once and the index
+    is kept up to date as strips are added through it, so armatures with hundreds of
+    animations don't need a full scan for every new one
+    """
+    def __init__(self, arm):
+        self.arm = arm
+        self.strips = {}
+        if arm.animation_data:
+            for track in arm.animation_data.nla_tracks:
+                for strip in track.strips:
+                    self.strips[strip.name] = strip
+
+    def __contains__(self, name):
+        return name in self.strips
+
+    def __len__(self):
+        return len(self.strips)
+
+    def get(self, name):
+        return self.strips.get(name)
+
+    def add(self, name, action, start = 1):
+        """
+        Add the action to the armature on a new track
+        """
+        if not self.arm.animation_data:
+            self.arm.animation_data_create()
+        track = self.arm.animation_data.nla_tracks.new()
+        track.name = f"track_{name}"
+        strip = track.strips.new(name, start, action)
+        self.strips[strip.name] = strip
+        return strip
+
+def reorder_nla_tracks(arm, tracks):
+    """
+    Rebuild the NLA tracks of the armature in the given order, bottom first.  This only
+    uses the data API so it works without a UI.  Returns False if the tracks can't be
+    rebuilt because they hold transitions, meta strips or animated strip settings
+    """
+    animation_data = arm.animation_data
+    if animation_data.use_tweak_mode:
+        return False
+    for track in animation_data.nla_tracks:
+        for strip in track.strips:
+            if strip.type != 'CLIP' or len(strip.fcurves):
+                return False
+
+    # Copy everything first as the strip names have to be free before they are reused
+    tracks = [
+        (
+            {name: getattr(track, name) for name in NLA_TRACK_PROPERTIES},
+            [
+                (strip.name, strip.frame_start, strip.action, {name: getattr(strip, name) for name in NLA_STRIP_PROPERTIES})
+                for strip in track.strips
+            ]
+        )
+        for track in tracks
+    ]
+    for track in list(animation_data.nla_tracks):
+        animation_data.nla_tracks.remove(track)
+
+    for track_properties, strips in tracks:
+        track = animation_data.nla_tracks.new()
+        for name, frame_start, action, strip_properties in strips:
+            # strips.new only takes whole frames.  Moving the strip afterwards keeps
+            # its length and puts back strips that started between frames
+            strip = track.strips.new(name, int(frame_start), action)
+            for key, value in strip_properties.items():
+                setattr(strip, key, value)
+            strip.frame_start_ui = frame_start
+        # Set last as a locked track can't be edited
+        for key, value in track_properties.items():
+            setattr(track, key, value)
+    return True
+
+def _move_tracks_to_bottom(tracks):
+    # Fallback for tracks the data API can't rebuild.  This needs the UI
+    area = bpy.context.area.type
+    bpy.context.area.type = 'NLA_EDITOR'
+    for track in tracks:
+        bpy.ops.anim.channels_select_all(action='DESELECT')
+        track.select = True
+        bpy.ops.anim.channels_move(direction='BOTTOM')
+    bpy.context.area.type = area
+
 def normalize_pose_animation(arm):
     """
     Moves a tpose or apose animation to the bottom of the animation list so it will
@@ -160,21 +496,42 @@ def normalize_pose_animation(arm):
     """
     if arm and arm.type == "ARMATURE" and arm.animation_data:
         # Find a pose animation
-        for track in arm.animation_data.nla_tracks:
-            if "pose" in track.name.lower():
-                area = bpy.context.area.type
-                bpy.context.area.type = 'NLA_EDITOR'
-                bpy.ops.anim.channels_select_all(action='DESELECT')
-                track.select = True
-                bpy.ops.anim.channels_move(direction='BOTTOM')
-                bpy.context.area.type = area
+        tracks = list(arm.animation_data.nla_tracks)
+        pose_tracks = [track for track in tracks if "pose" in track.name.lower()]
+        if not pose_tracks:
+            return
 
-def get_object_collection(ob):
+        # Each pose track is moved to the bottom in turn so the last one ends up first
+        ordered = pose_tracks[::-1] + [track for track in tracks if track not in pose_tracks]
+        if ordered == tracks:
+            return
+
+        if not reorder_nla_tracks(arm, ordered) and bpy.context.area:
+            _move_tracks_to_bottom(pose_tracks)
+
+def _build_object_collections():
+    # Map each object to the collections it is linked to in bpy.data order
+    object_collections = {}
     for collection in bpy.data.collections:
-        for obj in collection.objects:
-            if ob == obj:
-                return collection
-    return None
+        for ob in collection.objects:
+            object_collections.setdefault(ob.as_pointer(), []).append(collection)
+    return object_collections
+
+def get_object_collections(ob):
+    """
+    Returns the collections the object is linked to, not including the scene collection.
+    Inside a lookup_cache() block the index is only built once
+    """
+    return _get_cached("object_collections", _build_object_collections).get(ob.as_pointer(), [])
+
+def get_object_collection(ob):
+    collections = get_object_collections(ob)
+    return collections[0] if collections else None
+
+def get_export_collection(ob):
+    # The collection an object is exported from.  Objects that are only in the scene
+    # collection are exported from it, like users_collection[0]
+    return get_object_collection(ob) or bpy.context.scene.collection
 
 def select_collection(collection):
     bpy.ops.object.select_all(action='DESELECT')
@@ -197,10 +554,13 @@ class WIZ_OT_fracture_object(bpy.types.Operator):
         """
         set_object_mode()
 
+        # Each fracture only relinks its own object so the object to collection
+        # index built for the first one stays valid for the rest
         objects = bpy.context.selected_objects
-        for object in objects:
-            if object.type == "MESH":
-                WIZ_OT_fracture_object.fracture(object)
+        with lookup_cache():
+            for object in objects:
+                if object.type == "MESH":
+                    WIZ_OT_fracture_object.fracture(object)
 
         return {'FINISHED'}
 
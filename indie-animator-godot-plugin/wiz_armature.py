@@ -3,9 +3,26 @@ import sys
 import math
 import string
 import bpy
+from mathutils import Vector, Matrix
 from . utils import *
+from . skinning import skin_meshes
 from enum import Enum
 
+# Rigify operators that add each metarig
+RIGIFY_METARIGS = {
+    "human": "armature_human_metarig_add",
+    "basic_human": "armature_basic_human_metarig_add",
+    "quadruped": "armature_basic_quadruped_metarig_add",
+    "cat": "armature_cat_metarig_add",
+    "bird": "armature_bird_metarig_add",
+    "horse": "armature_horse_metarig_add",
+    "shark": "armature_shark_metarig_add",
+    "wolf": "armature_wolf_metarig_add",
+}
+
+# Folder in the user path the generated metarigs are kept in
+RIG_TEMPLATE_FOLDER = "rig_templates"
+
 class OBJECT_TYPE(Enum):
     THING = 0
     ARMATURE = 1
@@ -66,6 +83,78 @@ class BONE_NAME(Enum):
     IK_LEG_POLE_R = "RightIKLegPole"
     IK_LEG_TARGET_R = "RightIKLegTarget"
 
+class BoneSpec():
+    """
+    A bone of a generated armature.  Bones are laid out the way they are extruded in edit
+    mode: a bone starts at the tail of the extrude bone, the bone before it when not set,
+    and is connected to it.  With from_head it starts at the head of the extrude bone and
+    shares its parent instead.  The tail is the offset from the start.  detach then either
+    disconnects the bone ('DISCONNECT') or clears its parent ('CLEAR') and moves its head
+    by the head offset.  parent replaces the parent the layout gives the bone without
+    connecting them
+    """
+    def __init__(
+        self,
+        name: str,
+        offset,
+        extrude: str = None,
+        from_head: bool = False,
+        detach: str = None,
+        head_offset = (0, 0, 0),
+        parent: str = None,
+        roll: float = 0.0,
+        deform: bool = True,
+        inherit_rotation: bool = True):
+
+        self.name = name
+        self.offset = offset
+        self.extrude = extrude
+        self.from_head = from_head
+        self.detach = detach
+        self.head_offset = head_offset
+        self.parent = parent
+        self.roll = roll
+        self.deform = deform
+        self.inherit_rotation = inherit_rotation
+
+
+def get_bone_layout(bones):
+    """
+    Work out where the bone specs put each bone.  The first bone starts at the armature's
+    origin.  Returns the spec, head, tail, parent name and connection of every bone
+    """
+    layout = {}
+    previous = None
+    for spec in bones:
+        source = layout.get(spec.extrude or previous)
+        if source is None:
+            head = Vector((0, 0, 0))
+            parent = None
+            connect = False
+        elif spec.from_head:
+            head = source[1].copy()
+            parent = source[3]
+            connect = source[4]
+        else:
+            head = source[2].copy()
+            parent = source[0].name
+            connect = True
+
+        tail = head + Vector(spec.offset)
+        if spec.detach:
+            connect = False
+            if spec.detach == 'CLEAR':
+                parent = None
+            head = head + Vector(spec.head_offset)
+        if spec.parent is not None:
+            parent = spec.parent
+            connect = False
+
+        layout[spec.name] = (spec, head, tail, parent, connect)
+        previous = spec.name
+
+    return list(layout.values())
+
 class WIZ_OT_base_armature(bpy.types.Operator):
     bl_label = "Simple operator"
     bl_idname = "view3d.add_armature"
@@ -119,174 +208,129 @@ class WIZ_OT_base_armature(bpy.types.Operator):
         # Ensure the armature is the active object so the other meshes get stored under it
         bpy.context.view_layer.objects.active = arm
 
-        # Parent with automatic weights
-        bpy.ops.object.parent_set(type="ARMATURE_AUTO")
+        # Parent with automatic weights.  Heat weighting is Blender's own, the others are
+        # worked out from the distance to the bones which is much faster on dense meshes
+        method = bpy.context.scene.skin_weight_method
+        if method == 'HEAT':
+            bpy.ops.object.parent_set(type="ARMATURE_AUTO")
+        else:
+            meshes = [ob for ob in bpy.context.selected_objects if ob.type == "MESH"]
+            skin_meshes(arm, meshes, surface = method == 'SURFACE')
         WIZ_OT_base_armature.set_pose_mode()
         bpy.ops.pose.select_all(action="SELECT")
         bpy.ops.pose.armature_apply(selected=False)
 
 
-    def add_armature(
-        location,
-        radius: float):
-
-        bpy.ops.object.armature_add(
-            radius=radius,
-            enter_editmode=True,
-            align='WORLD',
-            location=location,
-            rotation=(0.0, 0.0, 0.0),
-            scale=(0.0, 0.0, 0.0))
-
-        bpy.context.active_bone.name = BONE_NAME.ROOT.value
-
-        bpy.context.active_object.show_in_front = True
-        bpy.context.active_object["godot_object_type"] = OBJECT_TYPE.ARMATURE.name
-        return bpy.context.active_object
-
-    def add_bone(name: str, location):
-
-        bpy.ops.armature.extrude_move(
-            ARMATURE_OT_extrude={
-                "forked":False},
-            TRANSFORM_OT_translate={
-                "value":location,
-                "constraint_axis":(False, False, False),
-                "mirror":False,
-                "snap":False,
-                "snap_target":'CLOSEST',
-                "snap_point":(0, 0, 0),
-                "snap_align":False,
-                "snap_normal":(0, 0, 0),
-                "gpencil_strokes":False,
-                "texture_space":False,
-                "remove_on_cancel":False,
-                "release_confirm":False,
-                "use_accurate":False})
-
-        bone = bpy.context.active_bone
-        bone.name = name
-        bone.roll = 0
-
-        return bone
-
-    def detach_bone(
-        bone,
-        head_offset = (0, 0, 0),
-        clear_parent = False):
+    def add_armature(location, bones):
+        """
+        Add an armature at the location with its bones created straight from the bone specs
+        instead of extruding them one at a time.  Leaves the armature in edit mode with the
+        first bone active like armature_add
+        """
+        data = bpy.data.armatures.new("Armature")
+        armature = bpy.data.objects.new("Armature", data)
+        bpy.context.collection.objects.link(armature)
+        armature.location = location
+        armature.show_in_front = True
+        armature["godot_object_type"] = OBJECT_TYPE.ARMATURE.name
+
+        for ob in bpy.context.view_layer.objects:
+            ob.select_set(False)
+        armature.select_set(True)
+        bpy.context.view_layer.objects.active = armature
+        WIZ_OT_base_armature.set_edit_mode()
 
-        bone.select = True
-        bpy.ops.armature.parent_clear(type='CLEAR' if clear_parent else 'DISCONNECT')
-        bone.select_head = True
-        bone.head = (
-            bone.head[0] + head_offset[0],
-            bone.head[1] + head_offset[1],
-            bone.head[2] + head_offset[2])
-        bone.select_tail = True
-        bone.roll = 0
+        edit_bones = data.edit_bones
+        layout = get_bone_layout(bones)
+        for spec, head, tail, parent, connect in layout:
+            bone = edit_bones.new(spec.name)
+            bone.head = head
+            bone.tail = tail
+            bone.roll = spec.roll
+            bone.use_deform = spec.deform
+            bone.use_inherit_rotation = spec.inherit_rotation
+
+        # Parent once every bone exists so a spec can name any bone as its parent
+        for spec, head, tail, parent, connect in layout:
+            if parent:
+                bone = edit_bones[spec.name]
+                bone.parent = edit_bones[parent]
+                bone.use_connect = connect
+
+        edit_bones.active = edit_bones[bones[0].name]
+        return armature
 
 
     def set_object_zero(ob):
         scene = bpy.context.scene
 
-        # Get all the z values of the faces
-        vertices = []
-        for face in ob.data.polygons:
-            face_vertices = face.vertices[:]
-            for vertex in face_vertices:
-                z = ob.data.vertices[vertex].co[2]
-                vertices.append(z)
+        # Get the lowest point of the mesh in world space
+        bounds = get_evaluated_bounds(ob)
+        if bounds is None:
+            return
 
         # Move the object to the zero point and reset the cursor
-        ob.location = (ob.location[0], ob.location[1], -min(vertices))
+        ob.location = (ob.location[0], ob.location[1], ob.location[2] - bounds[0][2])
         scene.cursor.location = (0, 0, 0)
 
-    def select_head(bone):
-        bpy.ops.armature.select_all(action='DESELECT')
-        bone.select_head = True
-
-    def select_tail(bone):
-        bpy.ops.armature.select_all(action='DESELECT')
-        bone.select_tail = True
+    def get_reference_bounds(reference_object):
+        # The world space bottom center and size of the object with its modifiers, so
+        # rotated, parented and mirrored objects are measured the way they are seen.
+        # Falls back to the origin and dimensions for objects without vertices
+        bounds = get_evaluated_bounds(reference_object)
+        if bounds is None:
+            return reference_object.matrix_world.to_translation(), tuple(reference_object.dimensions)
+        low, high = bounds
+        location = Vector(((low[0] + high[0]) * 0.5, (low[1] + high[1]) * 0.5, low[2]))
+        return location, tuple(float(size) for size in high - low)
 
     def create_humaniod_armature(reference_object):
         # Add the armature and all bones
-        loc = reference_object.location
-        width = reference_object.dimensions[0]
-        depth = reference_object.dimensions[1]
-        height = reference_object.dimensions[2]
+        loc, (width, depth, height) = WIZ_OT_base_armature.get_reference_bounds(reference_object)
         leg_height = height * 0.39
         head_height = height * 0.1
         torso_height = height * 0.35
-
-        # Spine
-        armature = WIZ_OT_base_armature.add_armature((0, 0, height * 0.44), torso_height * 0.1)
-        root_bone = armature.data.edit_bones.active
-        WIZ_OT_base_armature.add_bone(BONE_NAME.SPINE1.value, (0, 0, torso_height * 0.4))
-        shoulder_blade_bone = WIZ_OT_base_armature.add_bone(BONE_NAME.SPINE2.value, (0, 0, torso_height * 0.4))
-        WIZ_OT_base_armature.add_bone(BONE_NAME.SPINE3.value, (0, 0, torso_height * 0.2))
-
-        # Head
-        WIZ_OT_base_armature.add_bone(BONE_NAME.HEAD.value, (0, 0, head_height))
-
-        # Left arm
         arm_length = width / 2.0
-        WIZ_OT_base_armature.select_tail(shoulder_blade_bone)
-        left_shoulder_bone = WIZ_OT_base_armature.add_bone(
-            BONE_NAME.SHOULDER_L.value, (arm_length * 0.25, 0, 0))
-
-        #WIZ_OT_base_armature.detach_bone(
-        #    left_shoulder_bone,
-        #    (arm_length * 0.1, 0, -arm_length * 0.06))
-        left_upper_arm = WIZ_OT_base_armature.add_bone(BONE_NAME.UPPER_ARM_L.value, (arm_length * 0.26, 0.01, 0))
-        WIZ_OT_base_armature.add_bone(BONE_NAME.LOWER_ARM_L.value, (arm_length * 0.26, -0.01, 0))
-
-        # Left hand
-        wrist_bone = WIZ_OT_base_armature.add_bone(BONE_NAME.HAND_L.value, (arm_length * 0.08, 0, 0))
-        WIZ_OT_base_armature.add_bone(BONE_NAME.FINGER1_L.value, (arm_length * 0.04, 0, 0))
-        WIZ_OT_base_armature.add_bone(BONE_NAME.FINGER2_L.value, (arm_length * 0.04, 0, 0))
-        WIZ_OT_base_armature.add_bone(BONE_NAME.FINGER3_L.value, (arm_length * 0.04, 0, 0))
-        WIZ_OT_base_armature.select_tail(wrist_bone)
-        thumb_bone = WIZ_OT_base_armature.add_bone(BONE_NAME.THUMB1_L.value, (-arm_length * 0.005, -depth * 0.15, 0))
-        WIZ_OT_base_armature.add_bone(BONE_NAME.THUMB2_L.value, (0, -depth * 0.055, 0))
-        #WIZ_OT_base_armature.detach_bone(
-        #    thumb_bone,
-        #    (-arm_length * 0.005, -depth * 0.1, 0))
-
-        # Left leg
-        WIZ_OT_base_armature.select_tail(root_bone)
-        WIZ_OT_base_armature.add_bone(
-            BONE_NAME.HIP_JOINT_L.value, (width * 0.08, 0, 0))
-        left_femer = WIZ_OT_base_armature.add_bone(
-            BONE_NAME.UPPER_LEG_L.value, (0, 0.01, -(leg_height * 0.55)))
-        WIZ_OT_base_armature.add_bone(BONE_NAME.LOWER_LEG_L.value, (0, 0, -leg_height * 0.55))
-
-
-        ###left_femer = WIZ_OT_base_armature.add_bone(
-        ###    BONE_NAME.UPPER_LEG_L.value, (width * 0.08, 0.01, -(leg_height * 0.5) - (torso_height * 0.2)))
-        ###WIZ_OT_base_armature.detach_bone(
-        ###    left_femer,
-        ###    (width * 0.08, 0.0,  -torso_height * 0.2))
-        ###WIZ_OT_base_armature.add_bone(BONE_NAME.LOWER_LEG_L.value, (0, 0, -leg_height * 0.55))
-
-        # Left foot
-        left_foot_bone = WIZ_OT_base_armature.add_bone(BONE_NAME.FOOT_L.value, (0, -depth * 0.7, -leg_height * 0.1))
-        # Bone Relations remove inherit rotation for the foot.  Prevents unwanted rotations with IK bones.
-        left_foot_bone.use_inherit_rotation = False
-
-        # IK Leg Bones
-        WIZ_OT_base_armature.select_tail(left_femer)
-        left_IK_knee = WIZ_OT_base_armature.add_bone(BONE_NAME.IK_LEG_POLE_L.value, (0, -0.4, 0))
-        WIZ_OT_base_armature.detach_bone(
-            left_IK_knee,
-            (0, -0.3, 0), True)
-        WIZ_OT_base_armature.select_head(left_foot_bone)
-        left_IK_heel = WIZ_OT_base_armature.add_bone(BONE_NAME.IK_LEG_TARGET_L.value, (0, 0.1, 0))
-        WIZ_OT_base_armature.detach_bone(
-            left_IK_heel,
-            (0, 0, 0), True)
-        left_IK_knee.use_deform = False
-        left_IK_heel.use_deform = False
+
+        armature = WIZ_OT_base_armature.add_armature((0, 0, height * 0.44), [
+            # Spine
+            BoneSpec(BONE_NAME.ROOT.value, (0, 0, torso_height * 0.1)),
+            BoneSpec(BONE_NAME.SPINE1.value, (0, 0, torso_height * 0.4)),
+            BoneSpec(BONE_NAME.SPINE2.value, (0, 0, torso_height * 0.4)),
+            BoneSpec(BONE_NAME.SPINE3.value, (0, 0, torso_height * 0.2)),
+
+            # Head
+            BoneSpec(BONE_NAME.HEAD.value, (0, 0, head_height)),
+
+            # Left arm
+            BoneSpec(BONE_NAME.SHOULDER_L.value, (arm_length * 0.25, 0, 0), extrude = BONE_NAME.SPINE2.value),
+            BoneSpec(BONE_NAME.UPPER_ARM_L.value, (arm_length * 0.26, 0.01, 0)),
+            BoneSpec(BONE_NAME.LOWER_ARM_L.value, (arm_length * 0.26, -0.01, 0)),
+
+            # Left hand
+            BoneSpec(BONE_NAME.HAND_L.value, (arm_length * 0.08, 0, 0)),
+            BoneSpec(BONE_NAME.FINGER1_L.value, (arm_length * 0.04, 0, 0)),
+            BoneSpec(BONE_NAME.FINGER2_L.value, (arm_length * 0.04, 0, 0)),
+            BoneSpec(BONE_NAME.FINGER3_L.value, (arm_length * 0.04, 0, 0)),
+            BoneSpec(BONE_NAME.THUMB1_L.value, (-arm_length * 0.005, -depth * 0.15, 0), extrude = BONE_NAME.HAND_L.value),
+            BoneSpec(BONE_NAME.THUMB2_L.value, (0, -depth * 0.055, 0)),
+
+            # Left leg
+            BoneSpec(BONE_NAME.HIP_JOINT_L.value, (width * 0.08, 0, 0), extrude = BONE_NAME.ROOT.value),
+            BoneSpec(BONE_NAME.UPPER_LEG_L.value, (0, 0.01, -(leg_height * 0.55))),
+            BoneSpec(BONE_NAME.LOWER_LEG_L.value, (0, 0, -leg_height * 0.55)),
+
+            # Left foot.  Doesn't inherit rotation to prevent unwanted rotations with IK bones.
+            BoneSpec(BONE_NAME.FOOT_L.value, (0, -depth * 0.7, -leg_height * 0.1), inherit_rotation = False),
+
+            # IK Leg Bones
+            BoneSpec(
+                BONE_NAME.IK_LEG_POLE_L.value, (0, -0.4, 0), extrude = BONE_NAME.UPPER_LEG_L.value,
+                detach = 'CLEAR', head_offset = (0, -0.3, 0), deform = False),
+            BoneSpec(
+                BONE_NAME.IK_LEG_TARGET_L.value, (0, 0.1, 0), extrude = BONE_NAME.FOOT_L.value, from_head = True,
+                detach = 'CLEAR', deform = False),
+        ])
 
         # Constraints
         WIZ_OT_base_armature.add_ik_constraint(armature, BONE_NAME.LOWER_LEG_L.value, BONE_NAME.IK_LEG_TARGET_L.value, BONE_NAME.IK_LEG_POLE_L.value)
@@ -302,123 +346,86 @@ class WIZ_OT_base_armature(bpy.types.Operator):
 
     def create_quadruped_armature(reference_object):
         # Add the armature and all bones
-        loc = reference_object.location
-        width = reference_object.dimensions[0]
-        depth = reference_object.dimensions[1]
-        height = reference_object.dimensions[2]
+        loc, (width, depth, height) = WIZ_OT_base_armature.get_reference_bounds(reference_object)
         leg_height = height * 0.39
         head_height = height * 0.16
         torso_width = width * 0.5
         torso_height = height * 0.35
-
-        # Spine
-        armature = WIZ_OT_base_armature.add_armature((0, width * 0.5, height * 0.68), torso_width * 0.3)
-        root_bone = armature.data.edit_bones.active
-        WIZ_OT_base_armature.select_tail(root_bone)
-        root_bone.tail.y = root_bone.tail.y - width * 0.5
-        root_bone.tail.z = root_bone.tail.z - torso_height * 0.3
-
-        WIZ_OT_base_armature.add_bone(BONE_NAME.SPINE1.value, (0, -torso_width * 0.7, -0.01))
-        WIZ_OT_base_armature.add_bone(BONE_NAME.SPINE2.value, (0, -torso_width * 0.7, 0))
-        spine3_bone = WIZ_OT_base_armature.add_bone(BONE_NAME.SPINE3.value, (0, -torso_width * 0.58, 0.03))
-        WIZ_OT_base_armature.add_bone(BONE_NAME.NECK.value, (0, -torso_width * 0.48, 0.035))
-        head_bone = WIZ_OT_base_armature.add_bone(BONE_NAME.HEAD.value, (0, -torso_width * 0.7, torso_height * 0.5))
-
-        # Ear
-        WIZ_OT_base_armature.select_tail(head_bone)
-        ear_bone = WIZ_OT_base_armature.add_bone(BONE_NAME.EAR1_L.value, (depth * 0.07, torso_width * 0.1, 0))
-        WIZ_OT_base_armature.detach_bone(
-            ear_bone,
-            (torso_width * 0.5, torso_width * 0.1, -torso_height * 0.1))
-        WIZ_OT_base_armature.add_bone(BONE_NAME.EAR2_L.value, (0, 0, torso_height * 0.03))
-
-        # Tail
-        WIZ_OT_base_armature.select_head(root_bone)
-        head_tail_bone = WIZ_OT_base_armature.add_bone(BONE_NAME.TAIL1.value, (0, torso_width * 0.51, 0.0038))
-        WIZ_OT_base_armature.add_bone(BONE_NAME.TAIL2.value, (0, torso_width * 0.51, 0.0038))
-        WIZ_OT_base_armature.add_bone(BONE_NAME.TAIL3.value, (0, torso_width * 0.51, 0.0038))
-        mid_tail_bone = WIZ_OT_base_armature.add_bone(BONE_NAME.TAIL4.value, (0, torso_width * 0.51, 0.0038))
-        WIZ_OT_base_armature.add_bone(BONE_NAME.TAIL5.value, (0, torso_width * 0.51, 0.0038))
-        WIZ_OT_base_armature.add_bone(BONE_NAME.TAIL6.value, (0, torso_width * 0.51, 0.0038))
-        WIZ_OT_base_armature.add_bone(BONE_NAME.TAIL7.value, (0, torso_width * 0.51, 0.0038))
-        tail_bone = WIZ_OT_base_armature.add_bone(BONE_NAME.TAIL8.value, (0, torso_width * 0.51, 0.0038))
-        head_tail_bone.parent = root_bone
-
-        # Left leg
-        WIZ_OT_base_armature.select_tail(root_bone)
-        left_femer = WIZ_OT_base_armature.add_bone(
-            BONE_NAME.UPPER_LEG_L.value, (width * 0.35, width * 0.3, -(leg_height * 0.5) - (torso_height * 0.2)))
-        WIZ_OT_base_armature.detach_bone(
-            left_femer,
-            (width * 0.25, (leg_height * 0.4),  -torso_height * 0.2))
-        WIZ_OT_base_armature.add_bone(BONE_NAME.LOWER_LEG_L.value, (width * 0.05, width * 0.38, -leg_height * 0.42))
-
-        # Left foot
-        WIZ_OT_base_armature.add_bone(BONE_NAME.FOOT_L.value, (-width * 0.02, width * 0.02, -leg_height * 0.5))
-        left_toe_bone = WIZ_OT_base_armature.add_bone(BONE_NAME.TOE_L.value, (width * 0.02, -width * 0.1,0))
-        # Bone Relations remove inherit rotation for the foot.  Prevents unwanted rotations with IK bones.
-        left_toe_bone.use_inherit_rotation = False
-
-
-        # Left Front leg
-        WIZ_OT_base_armature.select_tail(spine3_bone)
-        left_shoulder = WIZ_OT_base_armature.add_bone(
-            BONE_NAME.SHOULDER_L.value, (width * 0.35, width * 0.05, -(leg_height * 0.5) - (torso_height * 0.2)))
-        WIZ_OT_base_armature.detach_bone(
-            left_shoulder,
-            (width * 0.25, leg_height * 0.2,  -torso_height * 0.2))
-        WIZ_OT_base_armature.add_bone(BONE_NAME.UPPER_ARM_L.value, (0, width * 0.05, -leg_height * 0.35))
-
-        # Left Front foot
-        WIZ_OT_base_armature.add_bone(BONE_NAME.LOWER_ARM_L.value, (width * 0.02, -width * 0.04, -leg_height * 0.68))
-        left_foot_bone = WIZ_OT_base_armature.add_bone(BONE_NAME.HAND_L.value, (width * 0.05, -width * 0.1,0))
-        # Bone Relations remove inherit rotation for the foot.  Prevents unwanted rotations with IK bones.
-        left_foot_bone.use_inherit_rotation = False
-
-
-        # IK Leg Bones
-        WIZ_OT_base_armature.select_tail(left_femer)
-        left_IK_knee = WIZ_OT_base_armature.add_bone(BONE_NAME.IK_LEG_POLE_L.value, (0, width * 0.7, 0))
-        WIZ_OT_base_armature.detach_bone(
-            left_IK_knee,
-            (0, width * 0.5, 0), True)
-        WIZ_OT_base_armature.select_head(left_toe_bone)
-        left_IK_heel = WIZ_OT_base_armature.add_bone(BONE_NAME.IK_LEG_TARGET_L.value, (0, width * 0.1, 0))
-        WIZ_OT_base_armature.detach_bone(
-            left_IK_heel,
-            (0, 0, 0), True)
-        left_IK_knee.use_deform = False
-        left_IK_heel.use_deform = False
-
-
-        # IK Front Leg Bones
-        WIZ_OT_base_armature.select_tail(left_shoulder)
-        left_IK_front_knee = WIZ_OT_base_armature.add_bone(BONE_NAME.IK_FRONT_LEG_POLE_L.value, (0, width * 0.7, -height * 0.3))
-        WIZ_OT_base_armature.detach_bone(
-            left_IK_front_knee,
-            (0, width * 0.5, -height * 0.3), True)
-        WIZ_OT_base_armature.select_head(left_foot_bone)
-        left_front_IK_heel = WIZ_OT_base_armature.add_bone(BONE_NAME.IK_FRONT_LEG_TARGET_L.value, (0, width * 0.1, 0))
-        WIZ_OT_base_armature.detach_bone(
-            left_front_IK_heel,
-            (0, 0, 0), True)
-        left_IK_front_knee.use_deform = False
-        left_front_IK_heel.use_deform = False
-
-
-        # IK Tail Bones
-        WIZ_OT_base_armature.select_tail(mid_tail_bone)
-        tail_IK_base = WIZ_OT_base_armature.add_bone(BONE_NAME.IK_TAIL_POLE.value, (0, 0, -width * 1.1))
-        WIZ_OT_base_armature.detach_bone(
-            tail_IK_base,
-            (0, 0, -width * 0.9), True)
-        WIZ_OT_base_armature.select_tail(tail_bone)
-        tail_IK_heel = WIZ_OT_base_armature.add_bone(BONE_NAME.IK_TAIL_TARGET.value, (0, width * 0.3, 0))
-        WIZ_OT_base_armature.detach_bone(
-            tail_IK_heel,
-            (0, width * 0.2, 0), True)
-        tail_IK_base.use_deform = False
-        tail_IK_heel.use_deform = False
+        tail_offset = (0, torso_width * 0.51, 0.0038)
+
+        armature = WIZ_OT_base_armature.add_armature((0, width * 0.5, height * 0.68), [
+            # Spine
+            BoneSpec(BONE_NAME.ROOT.value, (0, -width * 0.5, torso_width * 0.3 - torso_height * 0.3)),
+            BoneSpec(BONE_NAME.SPINE1.value, (0, -torso_width * 0.7, -0.01)),
+            BoneSpec(BONE_NAME.SPINE2.value, (0, -torso_width * 0.7, 0)),
+            BoneSpec(BONE_NAME.SPINE3.value, (0, -torso_width * 0.58, 0.03)),
+            BoneSpec(BONE_NAME.NECK.value, (0, -torso_width * 0.48, 0.035)),
+            BoneSpec(BONE_NAME.HEAD.value, (0, -torso_width * 0.7, torso_height * 0.5)),
+
+            # Ear
+            BoneSpec(
+                BONE_NAME.EAR1_L.value, (depth * 0.07, torso_width * 0.1, 0), extrude = BONE_NAME.HEAD.value,
+                detach = 'DISCONNECT', head_offset = (torso_width * 0.5, torso_width * 0.1, -torso_height * 0.1)),
+            BoneSpec(BONE_NAME.EAR2_L.value, (0, 0, torso_height * 0.03)),
+
+            # Tail
+            BoneSpec(
+                BONE_NAME.TAIL1.value, tail_offset, extrude = BONE_NAME.ROOT.value, from_head = True,
+                parent = BONE_NAME.ROOT.value),
+            BoneSpec(BONE_NAME.TAIL2.value, tail_offset),
+            BoneSpec(BONE_NAME.TAIL3.value, tail_offset),
+            BoneSpec(BONE_NAME.TAIL4.value, tail_offset),
+            BoneSpec(BONE_NAME.TAIL5.value, tail_offset),
+            BoneSpec(BONE_NAME.TAIL6.value, tail_offset),
+            BoneSpec(BONE_NAME.TAIL7.value, tail_offset),
+            BoneSpec(BONE_NAME.TAIL8.value, tail_offset),
+
+            # Left leg
+            BoneSpec(
+                BONE_NAME.UPPER_LEG_L.value, (width * 0.35, width * 0.3, -(leg_height * 0.5) - (torso_height * 0.2)),
+                extrude = BONE_NAME.ROOT.value,
+                detach = 'DISCONNECT', head_offset = (width * 0.25, (leg_height * 0.4), -torso_height * 0.2)),
+            BoneSpec(BONE_NAME.LOWER_LEG_L.value, (width * 0.05, width * 0.38, -leg_height * 0.42)),
+
+            # Left foot.  The toe doesn't inherit rotation to prevent unwanted rotations with IK bones.
+            BoneSpec(BONE_NAME.FOOT_L.value, (-width * 0.02, width * 0.02, -leg_height * 0.5)),
+            BoneSpec(BONE_NAME.TOE_L.value, (width * 0.02, -width * 0.1, 0), inherit_rotation = False),
+
+            # Left Front leg
+            BoneSpec(
+                BONE_NAME.SHOULDER_L.value, (width * 0.35, width * 0.05, -(leg_height * 0.5) - (torso_height * 0.2)),
+                extrude = BONE_NAME.SPINE3.value,
+                detach = 'DISCONNECT', head_offset = (width * 0.25, leg_height * 0.2, -torso_height * 0.2)),
+            BoneSpec(BONE_NAME.UPPER_ARM_L.value, (0, width * 0.05, -leg_height * 0.35)),
+
+            # Left Front foot.  Doesn't inherit rotation to prevent unwanted rotations with IK bones.
+            BoneSpec(BONE_NAME.LOWER_ARM_L.value, (width * 0.02, -width * 0.04, -leg_height * 0.68)),
+            BoneSpec(BONE_NAME.HAND_L.value, (width * 0.05, -width * 0.1, 0), inherit_rotation = False),
+
+            # IK Leg Bones
+            BoneSpec(
+                BONE_NAME.IK_LEG_POLE_L.value, (0, width * 0.7, 0), extrude = BONE_NAME.UPPER_LEG_L.value,
+                detach = 'CLEAR', head_offset = (0, width * 0.5, 0), deform = False),
+            BoneSpec(
+                BONE_NAME.IK_LEG_TARGET_L.value, (0, width * 0.1, 0), extrude = BONE_NAME.TOE_L.value, from_head = True,
+                detach = 'CLEAR', deform = False),
+
+            # IK Front Leg Bones
+            BoneSpec(
+                BONE_NAME.IK_FRONT_LEG_POLE_L.value, (0, width * 0.7, -height * 0.3), extrude = BONE_NAME.SHOULDER_L.value,
+                detach = 'CLEAR', head_offset = (0, width * 0.5, -height * 0.3), deform = False),
+            BoneSpec(
+                BONE_NAME.IK_FRONT_LEG_TARGET_L.value, (0, width * 0.1, 0), extrude = BONE_NAME.HAND_L.value, from_head = True,
+                detach = 'CLEAR', deform = False),
+
+            # IK Tail Bones
+            BoneSpec(
+                BONE_NAME.IK_TAIL_POLE.value, (0, 0, -width * 1.1), extrude = BONE_NAME.TAIL4.value,
+                detach = 'CLEAR', head_offset = (0, 0, -width * 0.9), deform = False),
+            BoneSpec(
+                BONE_NAME.IK_TAIL_TARGET.value, (0, width * 0.3, 0), extrude = BONE_NAME.TAIL8.value,
+                detach = 'CLEAR', head_offset = (0, width * 0.2, 0), deform = False),
+        ])
 
         # Constraints
         WIZ_OT_base_armature.add_ik_constraint(armature, BONE_NAME.FOOT_L.value, BONE_NAME.IK_LEG_TARGET_L.value, BONE_NAME.IK_LEG_POLE_L.value, 3)
@@ -441,16 +448,12 @@ class WIZ_OT_base_armature(bpy.types.Operator):
 
     def create_generic_armature(reference_object):
         # Add the armature and all bones
-        loc = reference_object.location
-        width = reference_object.dimensions[0]
-        depth = reference_object.dimensions[1]
-        height = reference_object.dimensions[2]
+        loc, (width, depth, height) = WIZ_OT_base_armature.get_reference_bounds(reference_object)
 
         # Spine
-        armature = WIZ_OT_base_armature.add_armature((loc.x, loc.y, loc.z + height * 0.5), height * 0.5)
-        root_bone = armature.data.edit_bones.active
-        WIZ_OT_base_armature.select_tail(root_bone)
-        root_bone.tail.z = root_bone.tail.z - height * 0.25
+        armature = WIZ_OT_base_armature.add_armature((loc.x, loc.y, loc.z + height * 0.5), [
+            BoneSpec(BONE_NAME.ROOT.value, (0, 0, height * 0.25)),
+        ])
 
         WIZ_OT_base_armature.set_pose_mode()
         order = 'ZYX'
@@ -470,17 +473,12 @@ class WIZ_OT_base_armature(bpy.types.Operator):
 
     def create_door_armature(reference_object):
         # Add the armature and all bones
-        loc = reference_object.location
-        width = reference_object.dimensions[0]
-        depth = reference_object.dimensions[1]
-        height = reference_object.dimensions[2]
+        loc, (width, depth, height) = WIZ_OT_base_armature.get_reference_bounds(reference_object)
 
         # Spine
-        armature = WIZ_OT_base_armature.add_armature((loc.x - width * 0.5, loc.y, loc.z + height * 0.5), width * 0.5)
-        root_bone = armature.data.edit_bones.active
-        WIZ_OT_base_armature.select_tail(root_bone)
-        root_bone.tail.x = root_bone.tail.x + width * 0.5
-        root_bone.tail.z = root_bone.tail.z - width * 0.25
+        armature = WIZ_OT_base_armature.add_armature((loc.x - width * 0.5, loc.y, loc.z + height * 0.5), [
+            BoneSpec(BONE_NAME.ROOT.value, (width * 0.5, 0, width * 0.25)),
+        ])
 
         WIZ_OT_base_armature.set_pose_mode()
         order = 'ZYX'
@@ -500,23 +498,15 @@ class WIZ_OT_base_armature(bpy.types.Operator):
 
     def create_double_door_armature(reference_object):
         # Add the armature and all bones
-        loc = reference_object.location
-        width = reference_object.dimensions[0]
-        depth = reference_object.dimensions[1]
-        height = reference_object.dimensions[2]
-
-        # Left Door Bone
-        armature = WIZ_OT_base_armature.add_armature((loc.x - width * 0.5, loc.y, loc.z + height * 0.5), width * 0.25)
-        left_door_bone = armature.data.edit_bones.active
-        WIZ_OT_base_armature.select_tail(left_door_bone)
-        left_door_bone.tail.x = left_door_bone.tail.x + width * 0.25
-        left_door_bone.tail.z = left_door_bone.tail.z - width * 0.25
-
-        # Right Door Bone
-        right_door_bone = WIZ_OT_base_armature.add_bone("root.right", (width * 0.5, 0, 0))
-        WIZ_OT_base_armature.detach_bone(
-            right_door_bone,
-            (width * 0.75, 0, 0), True)
+        loc, (width, depth, height) = WIZ_OT_base_armature.get_reference_bounds(reference_object)
+
+        armature = WIZ_OT_base_armature.add_armature((loc.x - width * 0.5, loc.y, loc.z + height * 0.5), [
+            # Left Door Bone
+            BoneSpec(BONE_NAME.ROOT.value, (width * 0.25, 0, 0)),
+
+            # Right Door Bone
+            BoneSpec("root.right", (width * 0.5, 0, 0), detach = 'CLEAR', head_offset = (width * 0.75, 0, 0)),
+        ])
 
         WIZ_OT_base_armature.set_pose_mode()
         order = 'ZYX'
@@ -579,31 +569,81 @@ class WIZ_OT_base_armature(bpy.types.Operator):
             constraint.target_space = 'WORLD'
             constraint.influence = 1.0
 
+def get_rig_template_file(type: str):
+    return os.path.join(get_user_path(), RIG_TEMPLATE_FOLDER, f"{type}.blend")
+
+def save_rig_template(type: str, armature):
+    """
+    Store a generated metarig so it can be appended next time without Rigify
+    """
+    path = get_rig_template_file(type)
+    create_folders(path)
+
+    # Write to a temporary file first so a failed write can't leave half a template
+    temp_file = f"{path}.{os.getpid()}.tmp"
+    bpy.data.libraries.write(temp_file, {armature}, fake_user=True)
+    os.replace(temp_file, path)
+
+def load_rig_template(type: str):
+    """
+    Append a stored metarig to the scene at the cursor.  Returns None if there isn't one
+    """
+    path = get_rig_template_file(type)
+    if not os.path.exists(path):
+        return None
+
+    with bpy.data.libraries.load(path, link=False) as (data_from, data_to):
+        data_to.objects = data_from.objects[:1]
+    if not data_to.objects:
+        return None
+
+    armature = data_to.objects[0]
+    armature.use_fake_user = False
+    armature.data.use_fake_user = False
+    armature.location = bpy.context.scene.cursor.location
+    bpy.context.collection.objects.link(armature)
+
+    WIZ_OT_base_armature.set_object_mode()
+    for ob in bpy.context.view_layer.objects:
+        ob.select_set(False)
+    armature.select_set(True)
+    bpy.context.view_layer.objects.active = armature
+    return armature
+
+def fit_armature(armature, reference_object):
+    """
+    Scale the armature's bones so it is as tall as the reference object
+    """
+    bpy.context.view_layer.update()
+    height = armature.dimensions[2]
+    if not reference_object or height <= 0:
+        return
+    reference_height = WIZ_OT_base_armature.get_reference_bounds(reference_object)[1][2]
+    if reference_height > 0:
+        armature.data.transform(Matrix.Scale(reference_height / height, 4))
+
 def add_rigify_arm(type: str):
-        try:
-            if type == "human":
-                bpy.ops.object.armature_human_metarig_add()
-            if type == "basic_human":
-                bpy.ops.object.armature_basic_human_metarig_add()
-            if type == "quadruped":
-                bpy.ops.object.armature_basic_quadruped_metarig_add()
-            if type == "cat":
-                bpy.ops.object.armature_cat_metarig_add()
-            if type == "bird":
-                bpy.ops.object.armature_bird_metarig_add()
-            if type == "horse":
-                bpy.ops.object.armature_horse_metarig_add()
-            if type == "shark":
-                bpy.ops.object.armature_shark_metarig_add()
-            if type == "wolf":
-                bpy.ops.object.armature_wolf_metarig_add()
-
-            bpy.context.active_object["godot_object_type"] = OBJECT_TYPE.ARMATURE.name
-            WIZ_OT_base_armature.set_pose_mode()
-            bpy.context.active_object.show_in_front = True
-
-        except AttributeError:
-            info("Please install the rigify plugin first")
+        reference_object = bpy.context.active_object
+        if reference_object and reference_object.type != "MESH":
+            reference_object = None
+
+        # Metarigs made before are appended from the templates so Rigify is only
+        # needed the first time each one is added
+        armature = load_rig_template(type)
+        if not armature:
+            try:
+                getattr(bpy.ops.object, RIGIFY_METARIGS[type])()
+            except AttributeError:
+                info("Please install the rigify plugin first")
+                return {'FINISHED'}
+            WIZ_OT_base_armature.set_object_mode()
+            armature = bpy.context.active_object
+            save_rig_template(type, armature)
+
+        fit_armature(armature, reference_object)
+        armature["godot_object_type"] = OBJECT_TYPE.ARMATURE.name
+        WIZ_OT_base_armature.set_pose_mode()
+        armature.show_in_front = True
         return {'FINISHED'}
 
 
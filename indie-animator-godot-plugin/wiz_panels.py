@@ -20,6 +20,7 @@ from . normal_maps import (
     update_base_texture_settings,
 )
 from . animations import import_animations, edit_animation
+from . profiling import last_profiles
 
 # pylint: disable=no-method-argument
 
@@ -84,6 +85,31 @@ class WIZ_PT_wiz_3D_export_details(bpy.types.Panel, Base_Panel):
             default="")
         scene.godot_prefab_path = Base_Panel.add_string("Path to the godot Prefabs Folder", "")
         scene.auto_godot_folder_setup = Base_Panel.add_checkbox("Create a godot folder structure based\non the collection hierarchy in Blender", False)
+        scene.force_export = Base_Panel.add_checkbox("Export even if nothing changed since the last export", False)
+        scene.export_workers = Base_Panel.add_int(0, 256, 0)
+        scene.profile_exports = Base_Panel.add_checkbox("Record the time and memory of each export step", False)
+        scene.export_mode = bpy.props.EnumProperty(
+            name = "",
+            description = "Choose what goes in the exported files",
+            items = [
+                ("FULL", "Mesh and Animations", "Export the model with all of its animations in one file"),
+                ("MESH", "Mesh Only", "Export the model without its animations"),
+                ("ANIMATIONS", "Animations Only", "Export each animation to its own file with only the skeleton"),
+            ]
+        )
+        scene.export_action_filter = Base_Panel.add_string("Only export the animations whose names contain one of these comma separated words", "")
+        scene.share_textures = Base_Panel.add_checkbox("Write the textures once to the Godot textures folder instead of embedding them in every file", False)
+        scene.godot_texture_path = Base_Panel.add_string("Path to the godot Textures Folder", "textures")
+        scene.texture_max_size = Base_Panel.add_int(0, 16384, 0)
+        scene.texture_format = bpy.props.EnumProperty(
+            name = "",
+            description = "Choose the format of the exported textures",
+            items = [
+                ("AUTO", "Automatic", "Keep PNG textures as PNG and JPEG textures as JPEG"),
+                ("JPEG", "JPEG", "Convert the textures to JPEG"),
+            ]
+        )
+        scene.level_size_threshold = Base_Panel.add_float(0, 100000, 5)
 
     def unregister():
         Base_Panel._unregister(bpy.types.Scene)
@@ -103,6 +129,19 @@ class WIZ_PT_wiz_3D_export_details(bpy.types.Panel, Base_Panel):
             self.add_label(context, self.layout, f"Prefabs Location:", alignment = 'LEFT')
             self.add_control(context, layout, "godot_prefab_path", "", percentage=1, alignment = 'RIGHT')
             self.add_control(context, layout, 'auto_godot_folder_setup', 'Auto Hierarchy', percentage=0.75)
+            self.add_control(context, layout, 'force_export', 'Force Export', percentage=0.75)
+            self.add_control(context, layout, 'export_workers', 'Workers (0 = Auto)')
+            self.add_control(context, layout, 'profile_exports', 'Profile Exports', percentage=0.75)
+            self.add_control(context, layout, 'export_mode', 'Export Mode')
+            if scene.export_mode == 'ANIMATIONS':
+                self.add_control(context, layout, 'export_action_filter', 'Animations')
+            self.add_control(context, layout, 'share_textures', 'Share Textures', percentage=0.75)
+            if scene.share_textures:
+                self.add_label(context, self.layout, f"Textures Location:", alignment = 'LEFT')
+                self.add_control(context, layout, "godot_texture_path", "", percentage=1, alignment = 'RIGHT')
+            self.add_control(context, layout, 'texture_max_size', 'Max Texture Size (0 = Any)')
+            self.add_control(context, layout, 'texture_format', 'Texture Format')
+            self.add_control(context, layout, 'level_size_threshold', 'Level Size')
 
 
 class WIZ_PT_wiz_3D_exports(bpy.types.Panel, Base_Panel):
@@ -127,6 +166,19 @@ class WIZ_PT_wiz_3D_exports(bpy.types.Panel, Base_Panel):
         if scene.scene_export_destination:
             row = self.add_button(context, layout, 'view3d.export_glb_individual', 'Individual')
             self.add_button(context, layout, 'view3d.export_glb_collection', 'Collection', row)
+            row = self.add_button(context, layout, 'view3d.export_glb_all', 'All Collections')
+            self.add_button(context, layout, 'view3d.export_glb_all_parallel', 'Parallel', row)
+
+            # Summary of the last profiled export
+            if scene.profile_exports and last_profiles:
+                self.add_spacer(context, layout)
+                self.add_label(context, layout, "Last Export:", alignment = 'LEFT')
+                for profile in last_profiles[-10:]:
+                    slowest = profile.slowest_phase()
+                    text = f"{profile.name}: {profile.seconds:.2f}s"
+                    if slowest:
+                        text += f" ({slowest['phase']} {slowest['seconds']:.2f}s)"
+                    self.add_label(context, layout, text, alignment = 'LEFT')
         else:
             self.add_label(context, layout, "Select a Game project for more options", alignment = 'LEFT')
 
@@ -304,6 +356,15 @@ class WIZ_PT_wiz_armature_panel(bpy.types.Panel, Base_Panel):
     def register():
         scene = bpy.types.Scene
         scene.collider_offset = Base_Panel.add_float(-100, 100.0, 0)
+        scene.skin_weight_method = bpy.props.EnumProperty(
+            name = "",
+            description = "Choose how the mesh is weighted to the bones when it is assigned",
+            items = [
+                ("HEAT", "Heat", "Blender's heat weighting.  Slow on dense meshes"),
+                ("DISTANCE", "Distance", "Weight each vertex to its closest bones"),
+                ("SURFACE", "Surface", "Weight each vertex to its closest bones measured over the mesh so weights don't cross gaps"),
+            ]
+        )
 
 
     def unregister():
@@ -332,6 +393,7 @@ class WIZ_PT_wiz_armature_panel(bpy.types.Panel, Base_Panel):
         self.add_label(context, self.layout, "Action:")
         row = self.add_button(context, layout, 'view3d.symeterize_armature', 'Symeterize')
         self.add_button(context, layout, 'view3d.parent_armature', 'Assign', row)
+        self.add_control(context, layout, 'skin_weight_method', 'Weights')
         #self.add_button(context, layout, 'view3d.set_t_pose', 'TPose', percentage=0.5)
 
 
@@ -344,6 +406,12 @@ class WIZ_PT_wiz_animation_panel(bpy.types.Panel, Base_Panel):
         scene = bpy.types.Scene
         scene.animation_file = Base_Panel.add_file_browser(description="Load Animation File", updateFn=import_animations)
         scene.edit_animation_file = Base_Panel.add_file_browser(description="Load Animation File", updateFn=edit_animation)
+        scene.animation_folder = Base_Panel.add_folder_browser(description="Folder of fbx and bvh animation files to import")
+        scene.animation_workers = Base_Panel.add_int(0, 256, 0)
+        scene.compress_animations = Base_Panel.add_checkbox("Remove the keyframes of imported animations that can be rebuilt within the tolerance", False)
+        scene.compress_tolerance = Base_Panel.add_float(0, 1, 0.001)
+        scene.extract_root_motion = Base_Panel.add_checkbox("Move the ground travel of imported animations into a root_motion property so they play in place", False)
+        scene.root_motion_bone = Base_Panel.add_string("Bone that carries the root motion (empty: the top bone of the armature)", "")
 
     def unregister():
         Base_Panel._unregister(bpy.types.Scene)
@@ -352,6 +420,14 @@ class WIZ_PT_wiz_animation_panel(bpy.types.Panel, Base_Panel):
         layout = self.layout
 
         self.add_control(context, layout, "animation_file", "Load Animation", percentage=0.75, alignment = 'LEFT')
+        self.add_control(context, layout, "animation_folder", "Load Folder", percentage=0.75, alignment = 'LEFT')
+        self.add_control(context, layout, 'animation_workers', 'Workers (0 = Auto)')
+        self.add_button(context, layout, 'view3d.import_animation_folder', 'Import Folder', percentage=0.5)
+        self.add_control(context, layout, 'compress_animations', 'Compress', percentage=0.75)
+        self.add_control(context, layout, 'compress_tolerance', 'Tolerance')
+        self.add_button(context, layout, 'view3d.compress_animations', 'Compress Animations', percentage=0.5)
+        self.add_control(context, layout, 'extract_root_motion', 'Root Motion', percentage=0.75)
+        self.add_control(context, layout, 'root_motion_bone', 'Root Bone')
         self.add_control(context, layout, "edit_animation_file", "Edit Animation", percentage=0.75, alignment = 'LEFT')
         self.add_button(
             context,
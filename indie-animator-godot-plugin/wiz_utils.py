@@ -7,7 +7,7 @@ import json
 import time
 import string
 from math import fabs, pi
-from mathutils import Vector
+from mathutils import Vector, Matrix
 from pprint import pprint
 from math import radians
 from pathlib import Path
@@ -20,6 +20,37 @@ import uuid
 from . utils import *
 
 from . draw import create_gradient_pallet
+from . export_cache import get_export_fingerprint, is_export_current, record_export
+from . profiling import profile_session, profile_phase, begin_asset_profile, end_asset_profile
+from . keyframes import get_nla_actions
+from . textures import get_texture_settings, swap_textures, restore_textures, export_gltf
+
+# Settings passed to the glTF exporter.  These are also part of the export
+# fingerprint so changing them forces a re-export
+GLTF_EXPORT_SETTINGS = {
+    "export_format": 'GLB',
+    "export_image_format": 'AUTO',
+    "export_texture_dir": '',
+    "export_materials": 'EXPORT',
+    "export_colors": True,
+    "export_normals": True,
+    "export_cameras": False,
+    "export_lights": False,
+    "export_force_sampling": False,
+    "export_extras": True,
+    "use_selection": True,  # Export only selected objects
+    "export_yup": True,  # Change to True if your model has Y-up orientation
+    "export_apply": False,  # Apply modifiers (set to True if needed)
+    "export_animations": True,
+    "export_anim_single_armature": True,
+    #"export_animation_mode": 'NLA_TRACKS',
+}
+
+class ExportSkipped(Exception):
+    """
+    Raised when an object or collection can't be exported with the current settings.
+    The message says why
+    """
 
 class StateSnapshot():
     def __init__(self):
@@ -101,15 +132,18 @@ class WIZ_OT_export_glb_individual(bpy.types.Operator):
         # If we are in edit mode switch to object mode
         set_object_mode()
 
-        if not WIZ_OT_export_glb_individual.update_selection():
-            return {'FINISHED'}
+        with profile_session(), lookup_cache():
+            with profile_phase("selection"):
+                selection_valid = WIZ_OT_export_glb_individual.update_selection()
+            if not selection_valid:
+                return {'FINISHED'}
 
-        state = StateSnapshot()
+            state = StateSnapshot()
 
-        if bpy.context.view_layer.objects.active:
-            WIZ_OT_export_glb_individual.export_individual(scene)
+            if bpy.context.view_layer.objects.active:
+                WIZ_OT_export_glb_individual.export_individual(scene)
 
-        state.Restore()
+            state.Restore()
 
         return {'FINISHED'}
 
@@ -121,7 +155,10 @@ class WIZ_OT_export_glb_individual(bpy.types.Operator):
             obj.select_set(True)
 
             # Export
-            _export_glb(scene, obj, obj.users_collection[0], False)
+            try:
+                _export_glb(scene, obj, get_export_collection(obj), False)
+            except ExportSkipped as err:
+                info(f"{obj.name}: {err}")
 
 
     def update_selection():
@@ -170,20 +207,23 @@ class WIZ_OT_export_glb_collection(bpy.types.Operator):
         # If we are in edit mode switch to object mode
         set_object_mode()
 
-        if not WIZ_OT_export_glb_collection.update_selection():
-            return {'FINISHED'}
+        with profile_session(), lookup_cache():
+            with profile_phase("selection"):
+                selection_valid = WIZ_OT_export_glb_collection.update_selection()
+            if not selection_valid:
+                return {'FINISHED'}
 
-        scene = bpy.context.scene
+            scene = bpy.context.scene
 
-        state = StateSnapshot()
+            state = StateSnapshot()
 
-        if bpy.context.view_layer.objects.active:
-            if not WIZ_OT_export_glb_collection.check_config():
-                        info("Please don't export armature objects with non-armature objects")
-                        return {'FINISHED'}
-            WIZ_OT_export_glb_collection.export_collection(scene)
+            if bpy.context.view_layer.objects.active:
+                if not WIZ_OT_export_glb_collection.check_config():
+                            info("Please don't export armature objects with non-armature objects")
+                            return {'FINISHED'}
+                WIZ_OT_export_glb_collection.export_collection(scene)
 
-        state.Restore()
+            state.Restore()
 
         return {'FINISHED'}
 
@@ -191,7 +231,7 @@ class WIZ_OT_export_glb_collection(bpy.types.Operator):
         # Use the collection name as the name of the glb file.  If none exists use a default name.
         ob = bpy.context.active_object
         #collection = bpy.context.view_layer.active_layer_collection
-        collection = ob.users_collection[0]
+        collection = get_export_collection(ob)
         if not collection:
             info("Please select something in a collection")
             return {'FINISHED'}
@@ -200,12 +240,11 @@ class WIZ_OT_export_glb_collection(bpy.types.Operator):
         for obj in collection.all_objects:
             obj.select_set(True)
 
-        bpy.ops.view3d.snap_cursor_to_center()
-
-        bpy.context.scene.tool_settings.transform_pivot_point = 'CURSOR'
-
         # Export
-        _export_glb(scene, collection, collection, True)
+        try:
+            _export_glb(scene, collection, collection, True)
+        except ExportSkipped as err:
+            info(f"{collection.name}: {err}")
 
         bpy.ops.object.select_all(action='DESELECT')
 
@@ -251,7 +290,7 @@ class WIZ_OT_export_glb_collection(bpy.types.Operator):
                         bpy.context.view_layer.objects.active = ob
                 return True
         else:
-            collection = bpy.context.active_object.users_collection[0]
+            collection = get_export_collection(bpy.context.active_object)
 
         # Check the collection for anything that has an armature.  If
         # one is found we want to export as a collection.  If not, we
@@ -295,7 +334,7 @@ class WIZ_OT_export_glb_collection(bpy.types.Operator):
                         bpy.context.view_layer.objects.active = ob
             return False
         else:
-            collection = bpy.context.active_object.users_collection[0]
+            collection = get_export_collection(bpy.context.active_object)
 
         # Check the collection for anything that has an armature.  If
         # one is found we want to export as a collection.  If not, we
@@ -331,156 +370,260 @@ def _get_center(collection):
         ob = collection.all_objects[0]
         return (ob.location.x, ob.location.y, ob.location.z)
 
-    leftX = None
-    rightX = None
-    forwardY = None
-    backY = None
     for ob in collection.all_objects:
         if ob.type == "ARMATURE":
             return (ob.location.x, ob.location.y, ob.location.z)
-        if not leftX or leftX > ob.location.x:
-            leftX = ob.location.x
-        if not rightX or rightX < ob.location.x:
-            rightX = ob.location.x
-        if not forwardY or forwardY < ob.location.y:
-            forwardY = ob.location.y
-        if not backY or backY > ob.location.y:
-            backY = ob.location.y
+
+    # The objects are moved back after every export so the center is only worked out
+    # once per collection in an export run
+    return _get_cached(("collection_center", collection.as_pointer()), lambda: _get_bounds_center(collection))
+
+def _get_bounds_center(collection):
+    # Use the bounding boxes of the objects so the center is the middle of
+    # the geometry and not just of the object origins
+    bounds = get_world_bound_box(list(collection.all_objects))
+    if bounds is None:
+        return (0, 0, 0)
+    low, high = bounds
+
     # If the world origin is within the collection and the collection is big
     # enough return 0 so it will not move
-    width = rightX - leftX
-    gurth = forwardY - backY
-    if width > 5 and gurth > 5 and leftX <= 0 and rightX >= 0 and forwardY >= 0 and backY <= 0:
+    threshold = bpy.context.scene.level_size_threshold
+    width = high[0] - low[0]
+    gurth = high[1] - low[1]
+    if width > threshold and gurth > threshold and low[0] <= 0 <= high[0] and low[1] <= 0 <= high[1]:
         return (0, 0, 0)
 
     # Return the center of the objects.  Always assume the z is correct
-    centerX = leftX + width / 2
-    centerY = backY + gurth / 2
-    return (centerX, centerY, 0)
+    return (float(low[0] + width / 2), float(low[1] + gurth / 2), 0)
+
+class TransformSnapshot():
+    """
+    Stores the transform channels of objects so they can be put back exactly as they were
+    """
+    def __init__(self, objects):
+        self.transforms = [
+            (ob, ob.location.copy(), ob.rotation_euler.copy(), ob.rotation_quaternion.copy(), tuple(ob.rotation_axis_angle), ob.scale.copy())
+            for ob in objects
+        ]
 
-def _export_glb(scene, obj, collection, collection_selected):
+    def Restore(self):
+        for ob, location, rotation_euler, rotation_quaternion, rotation_axis_angle, scale in self.transforms:
+            ob.location = location
+            ob.rotation_euler = rotation_euler
+            ob.rotation_quaternion = rotation_quaternion
+            ob.rotation_axis_angle = rotation_axis_angle
+            ob.scale = scale
+        bpy.context.view_layer.update()
+
+
+def _get_root_objects(objects):
+    """
+    Returns the objects that don't have an ancestor in the list.  Moving these
+    moves everything else along with them
+    """
+    selected = set(objects)
+    roots = []
+    for ob in objects:
+        parent = ob.parent
+        while parent and parent not in selected:
+            parent = parent.parent
+        if not parent:
+            roots.append(ob)
+    return roots
+
+
+def _move_to_origin(objects, location, rotate):
+    """
+    Moves the objects so the location ends up at the world origin, optionally turning them
+    around the Z axis.  Returns a snapshot to restore the original transforms
+    """
+    matrix = Matrix.Translation(-Vector(location))
+    if rotate:
+        matrix = Matrix.Rotation(pi, 4, 'Z') @ matrix
+
+    roots = _get_root_objects(objects)
+    transforms = TransformSnapshot(roots)
+    for ob in roots:
+        ob.matrix_world = matrix @ ob.matrix_world
+    bpy.context.view_layer.update()
+    return transforms
+
+
+def remove_unused_actions():
+    """
+    Remove any unused actions so they don't show in the final glb
+    """
+    for action in bpy.data.actions:
+        if action.users == 0 and not action.use_fake_user:
+            bpy.data.actions.remove(action)
+
+def _filter_actions(actions, action_filter):
+    """
+    Keep the actions whose names contain one of the comma separated filter words
+    """
+    words = [word.strip().lower() for word in action_filter.split(",") if word.strip()]
+    if not words:
+        return actions
+    return [action for action in actions if any(word in action.name.lower() for word in words)]
+
+
+def _export_animations(scene, obj, arm, collection, collection_selected, purge_actions = True):
+    """
+    Export each animation of the armature to its own glb file with only the skeleton in it.
+    Godot then only re-imports the clips that changed.  The files go in a folder named
+    after the object next to the model.  Returns True if any file was written
+    """
+    actions = _filter_actions(get_nla_actions(arm), scene.export_action_filter)
+    if not actions:
+        raise ExportSkipped("No animations match the animation filter")
+
+    if purge_actions:
+        with profile_phase("remove_unused_actions"):
+            remove_unused_actions()
+
+    # Only the active action is exported so each file holds a single clip
+    settings = dict(GLTF_EXPORT_SETTINGS, export_nla_strips=False)
+    animation_data = arm.animation_data
+    active_action = animation_data.action
+    use_nla = animation_data.use_nla
+    selected_objects = bpy.context.selected_objects
+    for ob in selected_objects:
+        ob.select_set(False)
+    arm.select_set(True)
+
+    # The skeleton is moved the same way as for the model so the clips line up with it
+    with profile_phase("move_to_origin"):
+        location = _get_center(collection) if collection_selected else obj.location
+        transforms = _move_to_origin([arm], location, False)
+
+    exported = False
+    try:
+        animation_data.use_nla = False
+        for action in actions:
+            file = os.path.join(f"{obj.name.lower()}_animations", f"{bpy.path.clean_name(action.name).lower()}.glb")
+            dest = get_godot_prefabs_path(collection, collection_selected, file)
+            begin_asset_profile(f"{obj.name}/{action.name}")
+            animation_data.action = action
+
+            # Only this clip is part of the fingerprint so adding or changing another
+            # clip doesn't re-export this one
+            try:
+                with profile_phase("fingerprint"):
+                    fingerprint = get_export_fingerprint([arm], settings, {action.name: action})
+                if not is_export_current(dest, fingerprint):
+                    with profile_phase("gltf_export"):
+                        bpy.ops.export_scene.gltf(filepath=dest, **settings)
+                    record_export(dest, fingerprint)
+                    exported = True
+            finally:
+                end_asset_profile(dest)
+    finally:
+        animation_data.action = active_action
+        animation_data.use_nla = use_nla
+        with profile_phase("restore_transforms"):
+            transforms.Restore()
+        arm.select_set(False)
+        for ob in selected_objects:
+            ob.select_set(True)
+
+    return exported
+
+
+def _export_glb(scene, obj, collection, collection_selected, purge_actions = True):
     scene = bpy.context.scene
     if obj.hide_viewport == False:
         extension = "glb"
         dest = get_godot_prefabs_path(collection, collection_selected, f"{obj.name.lower()}.{extension}")
 
-        arm_exists = False
-        if collection and collection_selected:
-            for ob in collection.all_objects:
-                if ob.type == "ARMATURE":
-                    normalize_pose_animation(ob)
-                    arm_exists = True
-                    break
+        if scene.export_mode == 'ANIMATIONS':
+            if not collection_selected:
+                raise ExportSkipped("Animations can only be exported from a collection")
+            if not any(ob.type == "ARMATURE" for ob in collection.all_objects):
+                raise ExportSkipped("No armature to export the animations of")
+
+        # The profile is started before the armature is prepared so that time is part of
+        # this asset.  It is ended even if the export fails so its time isn't given to the
+        # next asset
+        begin_asset_profile(obj.name)
+        try:
+            arm = None
+            if collection and collection_selected:
+                for ob in collection.all_objects:
+                    if ob.type == "ARMATURE":
+                        with profile_phase("normalize_pose_animation"):
+                            normalize_pose_animation(ob)
+                        arm = ob
+                        break
+            arm_exists = arm is not None
+
+            if scene.export_mode == 'ANIMATIONS':
+                # Each clip gets its own profile
+                end_asset_profile(f"{os.path.splitext(dest)[0]}_animations")
+                return _export_animations(scene, obj, arm, collection, collection_selected, purge_actions)
+
+            # Shared textures need the separate glTF format so the file extension changes
+            texture_settings, extension = get_texture_settings(dest)
+            dest = f"{os.path.splitext(dest)[0]}.{extension}"
+            settings = dict(GLTF_EXPORT_SETTINGS, **texture_settings)
+
+            # A mesh only export leaves the animations out of the file and the fingerprint
+            actions = None
+            if scene.export_mode == 'MESH':
+                settings["export_animations"] = False
+                actions = {}
+
+            # Skip the export if nothing has changed since the last time this file was written.
+            # The level size only moves collections so individual objects ignore it
+            fingerprint_settings = dict(settings, texture_max_size=scene.texture_max_size)
+            if collection_selected:
+                fingerprint_settings["level_size_threshold"] = scene.level_size_threshold
+            with profile_phase("fingerprint"):
+                fingerprint = get_export_fingerprint(bpy.context.selected_objects, fingerprint_settings, actions)
+            if is_export_current(dest, fingerprint):
+                return False
+
+            # Move the objects to the 0, 0 point and rotate them so they will face the correct
+            # direction.  This is done with a single matrix and the original transforms are put
+            # back exactly afterwards so repeated exports can't drift
+            with profile_phase("move_to_origin"):
+                if collection_selected:
+                    location = _get_center(collection)
+                else:
+                    location = obj.location
+                transforms = _move_to_origin(bpy.context.selected_objects, location, not arm_exists)
+
+            swaps = []
+            try:
+                # Remove any unused actions so they don't show in the final glb.  Batch
+                # exports purge once up front instead of once per asset
+                if purge_actions:
+                    with profile_phase("remove_unused_actions"):
+                        remove_unused_actions()
+
+                # Use one scaled down image for each unique texture
+                with profile_phase("textures"):
+                    swaps = swap_textures(bpy.context.selected_objects, scene.texture_max_size)
+
+                with profile_phase("gltf_export"):
+                    export_gltf(dest, settings)
+
+                # Clear any bone transformations so our model ends up in a rest pose
+                #if arm_exists:
+                #    clear_transformations()
+            finally:
+                restore_textures(swaps)
+
+                # Move the objects back to where they were
+                with profile_phase("restore_transforms"):
+                    transforms.Restore()
+
+            record_export(dest, fingerprint)
+            return True
+        finally:
+            end_asset_profile(dest)
 
-        # Move the object to the 0, 0 point
-        if collection_selected:
-            last_location = _get_center(collection)
-        else:
-            last_location = obj.location
-        inv_location = (-last_location[0], -last_location[1], -last_location[2])
-        bpy.ops.transform.translate(
-            value=inv_location,
-            orient_axis_ortho='X',
-            orient_type='GLOBAL',
-            orient_matrix=((1, 0, 0), (0, 1, 0), (0, 0, 1)),
-            orient_matrix_type='GLOBAL',
-            mirror=False,
-            use_proportional_edit=False,
-            proportional_edit_falloff='SMOOTH',
-            proportional_size=1,
-            use_proportional_connected=False,
-            use_proportional_projected=False,
-            snap=False, snap_elements={'INCREMENT'},
-            use_snap_project=False,
-            snap_target='CLOSEST',
-            use_snap_self=True,
-            use_snap_edit=True,
-            use_snap_nonedit=True,
-            use_snap_selectable=False)
-        last_location = (-inv_location[0], -inv_location[1], -inv_location[2])
-
-
-        # Rotate all the selected objects so they will face the correct direction
-        if not arm_exists:
-            bpy.ops.transform.rotate(
-                value=pi,
-                orient_axis='Z',
-                orient_type='GLOBAL',
-                orient_matrix=((1, 0, 0), (0, 1, 0), (0, 0, 1)),
-                orient_matrix_type='GLOBAL',
-                constraint_axis=(False, False, True),
-                mirror=False,
-                use_proportional_edit=False,
-                proportional_edit_falloff='SMOOTH',
-                proportional_size=1,
-                use_proportional_connected=False,
-                use_proportional_projected=False)
-
-        # Remove any unused actions so they don't show in the final glb
-        for action in bpy.data.actions:
-            if action.users == 0 and not action.use_fake_user:
-                bpy.data.actions.remove(action)
-
-        bpy.ops.export_scene.gltf(
-            filepath=dest,
-            export_format='GLB',
-            export_image_format='AUTO',
-            export_texture_dir='',
-            export_materials='EXPORT',
-            export_colors=True,
-            export_normals=True,
-            export_cameras=False,
-            export_lights=False,
-            export_force_sampling=False,
-            export_extras=True,
-            use_selection=True,  # Export only selected objects
-            export_yup=True,  # Change to True if your model has Y-up orientation
-            export_apply=False,  # Apply modifiers (set to True if needed)
-            export_animations=True,
-            export_anim_single_armature=True,
-            #export_animation_mode='NLA_TRACKS',
-        )
-
-        # Clear any bone transformations so our model ends up in a rest pose
-        #if arm_exists:
-        #    clear_transformations()
-
-        # Rotate the selected objects back to what they were
-        if not arm_exists:
-            bpy.ops.transform.rotate(
-                value=pi,
-                orient_axis='Z',
-                orient_type='GLOBAL',
-                orient_matrix=((1, 0, 0), (0, 1, 0), (0, 0, 1)),
-                orient_matrix_type='GLOBAL',
-                constraint_axis=(False, False, True),
-                mirror=False,
-                use_proportional_edit=False,
-                proportional_edit_falloff='SMOOTH',
-                proportional_size=1,
-                use_proportional_connected=False,
-                use_proportional_projected=False)
-
-        # Move the object back to the previous point
-        bpy.ops.transform.translate(
-            value=last_location,
-            orient_axis_ortho='X',
-            orient_type='GLOBAL',
-            orient_matrix=((1, 0, 0), (0, 1, 0), (0, 0, 1)),
-            orient_matrix_type='GLOBAL',
-            mirror=False,
-            use_proportional_edit=False,
-            proportional_edit_falloff='SMOOTH',
-            proportional_size=1,
-            use_proportional_connected=False,
-            use_proportional_projected=False,
-            snap=False, snap_elements={'INCREMENT'},
-            use_snap_project=False,
-            snap_target='CLOSEST',
-            use_snap_self=True,
-            use_snap_edit=True,
-            use_snap_nonedit=True,
-            use_snap_selectable=False)
+    return False
 
 
 def update_text_size(caller, context):
@@ -0,0 +1,112 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "indie-animator-godot-plugin"))
+
+import bone_mapping
+
+# A humanoid armature using the add-on's bone names (BONE_NAME in wiz_armature.py)
+HUMANOID_BONES = [
+    "Root", "Spine", "Spine1", "Spine2", "Neck", "Head",
+    *[
+        f"{side}{bone}"
+        for side in ("Left", "Right")
+        for bone in (
+            "Shoulder", "Arm", "ForeArm", "Hand", "Thumb1", "Thumb2", "Finger1", "Finger2", "Finger3",
+            "UpLeg", "Leg", "Foot", "Toe")
+    ],
+]
+
+MIXAMO_BONES = [
+    "Hips", "Spine", "Spine1", "Spine2", "Neck", "Head", "HeadTop_End",
+    *[
+        f"{side}{bone}"
+        for side in ("Left", "Right")
+        for bone in (
+            "Shoulder", "Arm", "ForeArm", "Hand",
+            *[f"Hand{finger}{joint}" for finger in ("Thumb", "Index", "Middle", "Ring", "Pinky") for joint in range(1, 5)],
+            "UpLeg", "Leg", "Foot", "ToeBase", "Toe_End")
+    ],
+]
+
+# Deform bones of Rigify's human metarig, without the face
+RIGIFY_BONES = [
+    "spine", *[f"spine.00{index}" for index in range(1, 7)],
+    *[
+        f"{bone}.{suffix}"
+        for suffix in ("L", "R")
+        for bone in (
+            "shoulder", "upper_arm", "forearm", "hand",
+            *[f"{finger}.0{joint}" for finger in ("thumb", "f_index", "f_middle", "f_ring", "f_pinky") for joint in range(1, 4)],
+            *[f"palm.0{joint}" for joint in range(1, 5)],
+            "thigh", "shin", "foot", "toe", "pelvis", "breast")
+    ],
+    *[f"{bone}.{suffix}.001" for suffix in ("L", "R") for bone in ("upper_arm", "forearm", "thigh", "shin")],
+]
+
+
+@pytest.mark.parametrize("name, canonical", [
+    ("mixamorig:LeftArm", "LeftArm"),
+    ("mixamorig1:Hips", "Root"),
+    ("DEF-spine.006", "Head"),
+    ("DEF-upper_arm.L", "LeftArm"),
+    ("Spine", "Spine"),
+])
+def test_prefixes_are_removed(name, canonical):
+    assert bone_mapping.get_canonical_name(name) == canonical
+
+
+def test_bone_map_is_checked_before_and_after_prefixes():
+    bone_map = {"mixamorig:Hips": "Spine", "Neck": ""}
+    assert bone_mapping.get_canonical_name("mixamorig:Hips", bone_map) == "Spine"
+    assert bone_mapping.get_canonical_name("mixamorig:Neck", bone_map) == ""
+
+
+def test_mixamo_clip_matches_humanoid():
+    result = bone_mapping.check_bone_compatibility(
+        [f"mixamorig:{name}" for name in MIXAMO_BONES], HUMANOID_BONES)
+    assert result.compatible
+    assert result.coverage == 1.0
+    assert result.matched["mixamorig:Hips"] == "Root"
+    assert result.matched["mixamorig:LeftToeBase"] == "LeftToe"
+    assert result.matched["mixamorig:RightHandIndex3"] == "RightFinger3"
+    assert "mixamorig:LeftHandPinky2" in result.ignored
+    assert sorted(result.matched.values()) == sorted(HUMANOID_BONES)
+
+
+def test_rigify_clip_matches_humanoid():
+    result = bone_mapping.check_bone_compatibility([f"DEF-{name}" for name in RIGIFY_BONES], HUMANOID_BONES)
+    assert result.compatible, result.summary()
+    assert result.matched["DEF-spine"] == "Root"
+    assert result.matched["DEF-spine.006"] == "Head"
+    assert result.matched["DEF-thigh.R"] == "RightUpLeg"
+    assert {"DEF-spine.005", "DEF-upper_arm.L.001", "DEF-f_ring.02.R", "DEF-palm.03.L"} <= set(result.ignored)
+    assert sorted(result.matched.values()) == sorted(HUMANOID_BONES)
+
+
+def test_missing_bones_lower_coverage():
+    result = bone_mapping.check_bone_compatibility(["Hips", "Spine", "Tail", "Wing"], HUMANOID_BONES)
+    assert not result.compatible
+    assert result.missing == ["Tail", "Wing"]
+    assert result.coverage == 0.5
+    assert result.summary() == "2 of 4 bones matched (50%).  Missing: Tail, Wing"
+
+
+def test_renamed_only_lists_changed_names():
+    result = bone_mapping.check_bone_compatibility(["Hips", "Spine", "mixamorig:Neck"], HUMANOID_BONES)
+    assert result.renamed == {"Hips": "Root", "mixamorig:Neck": "Neck"}
+
+
+def test_destination_bones_are_matched_once():
+    # Both name Root once their prefixes are removed, the identical name wins
+    result = bone_mapping.check_bone_compatibility(["Root", "mixamorig:Hips"], HUMANOID_BONES)
+    assert result.matched == {"Root": "Root"}
+    assert result.missing == ["mixamorig:Hips"]
+
+
+def test_identical_names_match_without_a_map():
+    result = bone_mapping.check_bone_compatibility(["DEF-spine.005"], ["DEF-spine.005"])
+    assert result.matched == {"DEF-spine.005": "DEF-spine.005"}
+    assert not result.renamed
@@ -0,0 +1,103 @@
+import os
+import sys
+import struct
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "indie-animator-godot-plugin"))
+
+import skeleton_probe
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def _fbx_property(value):
+    if isinstance(value, int):
+        return b"L" + struct.pack("<q", value)
+    data = value.encode() if isinstance(value, str) else value
+    return b"S" + struct.pack("<I", len(data)) + data
+
+
+def _fbx_node(name, properties, children, offset, wide):
+    """
+    Encode a node record starting at the file offset.  Nodes with children end with
+    a null record like the files Blender and Maya write
+    """
+    header_size = 25 if wide else 13
+    data = b"".join(_fbx_property(value) for value in properties)
+    body = b""
+    position = offset + header_size + len(name) + len(data)
+    for child_name, child_properties, child_children in children:
+        child = _fbx_node(child_name, child_properties, child_children, position, wide)
+        body += child
+        position += len(child)
+    if children:
+        body += b"\x00" * header_size
+
+    end_offset = offset + header_size + len(name) + len(data) + len(body)
+    header_format = "<QQQB" if wide else "<IIIB"
+    header = struct.pack(header_format, end_offset, len(properties), len(data), len(name))
+    return header + name.encode() + data + body
+
+
+def write_binary_fbx(path, version, models):
+    wide = version >= 7500
+    data = skeleton_probe.FBX_BINARY_MAGIC + b"\x1a\x00" + struct.pack("<I", version)
+    nodes = [
+        ("FBXHeaderExtension", [], [("FBXVersion", [version], [])]),
+        ("Objects", [], [
+            ("Model", [1000 + index, f"{name}\x00\x01Model", kind], [("Version", [232], [])])
+            for index, (name, kind) in enumerate(models)
+        ]),
+    ]
+    for name, properties, children in nodes:
+        data += _fbx_node(name, properties, children, len(data), wide)
+    data += b"\x00" * (25 if wide else 13)
+    with open(path, "wb") as file:
+        file.write(data)
+
+
+MODELS = [
+    ("Armature", "Null"),
+    ("mixamorig:Hips", "Root"),
+    ("mixamorig:Spine", "LimbNode"),
+    ("mixamorig:Head", "LimbNode"),
+    ("OldBone", "Limb"),
+    ("Body", "Mesh"),
+]
+
+
+def test_bvh_joints():
+    assert skeleton_probe.read_skeleton(os.path.join(FIXTURES, "walk.bvh")) == ["Hips", "Spine", "Head", "LeftUpLeg"]
+
+
+def test_ascii_fbx_bones():
+    assert skeleton_probe.read_skeleton(os.path.join(FIXTURES, "walk_ascii.fbx")) == [
+        "mixamorig:Hips", "mixamorig:Spine", "mixamorig:Head"]
+
+
+@pytest.mark.parametrize("version", [7400, 7500])
+def test_binary_fbx_bones(tmp_path, version):
+    path = str(tmp_path / "walk.fbx")
+    write_binary_fbx(path, version, MODELS)
+    assert skeleton_probe.read_skeleton(path) == [
+        "mixamorig:Hips", "mixamorig:Spine", "mixamorig:Head", "OldBone"]
+
+
+def test_binary_fbx_without_bones(tmp_path):
+    path = str(tmp_path / "prop.fbx")
+    write_binary_fbx(path, 7400, [("Body", "Mesh")])
+    assert skeleton_probe.read_skeleton(path) is None
+
+
+def test_truncated_binary_fbx(tmp_path):
+    path = tmp_path / "broken.fbx"
+    write_binary_fbx(str(path), 7500, MODELS)
+    path.write_bytes(path.read_bytes()[:60])
+    assert skeleton_probe.read_skeleton(str(path)) is None
+
+
+def test_unreadable_files(tmp_path):
+    assert skeleton_probe.read_skeleton(str(tmp_path / "missing.bvh")) is None
+    (tmp_path / "clip.txt").write_text("HIERARCHY\nROOT Hips\n")
+    assert skeleton_probe.read_skeleton(str(tmp_path / "clip.txt")) is None